@@ -0,0 +1,59 @@
+# compare the parsing of the time axis of extractions, using the testing extractions
+# scaled up to a daily time series from 1601 to 2100, run from the root of the repository:
+#
+#   python benchmarks/read_time.py
+
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from isimip_qa.utils import parse_times
+
+extractions_path = Path('testing') / 'extractions'
+benchmarks_path = Path('testing') / 'tmp' / 'benchmarks'
+
+
+def parse_times_apply(times):
+    # the previous implementation, which parses every row in python,
+    # with pandas < 2.0, the dates before 1677 were dropped
+    def parse_time(time):
+        try:
+            return pd.Timestamp(np.datetime64(time))
+        except pd.errors.OutOfBoundsDatetime:
+            return pd.NaT
+
+    return times.apply(parse_time)
+
+
+def main():
+    benchmarks_path.mkdir(exist_ok=True, parents=True)
+
+    for extraction_path in sorted(extractions_path.glob('*_global_mean.csv')):
+        df = pd.read_csv(extraction_path)
+
+        # scale the extraction up to a daily time series
+        times = np.arange('1601-01-01', '2101-01-01', dtype='datetime64[D]')
+        values = np.resize(df['var'].to_numpy(), times.size)
+        path = benchmarks_path / extraction_path.name
+        pd.DataFrame({'time': times.astype(str), 'var': values}).to_csv(path, index=False)
+
+        times = pd.read_csv(path)['time']
+
+        start = time.perf_counter()
+        apply_times = parse_times_apply(times)
+        apply_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        vectorized_times = parse_times(times)
+        vectorized_seconds = time.perf_counter() - start
+
+        print(f'{extraction_path.name}: {times.size} rows, '
+              f'apply {apply_seconds:.3f}s ({apply_times.notnull().sum()} rows kept), '
+              f'vectorized {vectorized_seconds:.3f}s ({vectorized_times.notnull().sum()} rows kept), '
+              f'speedup {apply_seconds / vectorized_seconds:.0f}x')
+
+
+if __name__ == '__main__':
+    main()
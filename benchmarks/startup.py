@@ -0,0 +1,34 @@
+# measure the startup of the command line interface, i.e. the time until the help is printed,
+# and the modules which are imported on the way, run from the root of the repository:
+#
+#   python benchmarks/startup.py
+
+import subprocess
+import sys
+import time
+
+heavy_modules = ['matplotlib', 'pandas', 'xarray', 'dask', 'netCDF4']
+
+runs = 5
+
+
+def main():
+    code = (
+        'import sys\n'
+        'from isimip_qa.main import get_parser\n'
+        'get_parser().format_help()\n'
+        f'print(",".join(name for name in {heavy_modules!r} if name in sys.modules))\n'
+    )
+
+    seconds = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        output = subprocess.check_output([sys.executable, '-c', code], text=True)
+        seconds.append(time.perf_counter() - start)
+
+    print(f'startup: min {min(seconds):.3f}s, max {max(seconds):.3f}s over {runs} runs, '
+          f'heavy modules imported: {output.strip() or "none"}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+import numpy as np
+import pandas as pd
+
+
+class Histogram:
+
+    # number of bins for the initial range
+    size = 100
+
+    def __init__(self, vmin=None, vmax=None):
+        self.origin = None  # left edge of the bin with index 0
+        self.step = None    # width of the bins
+        self.stop = None    # right edge of the initial range, which is closed like in np.histogram
+        self.offset = 0     # index of the first bin stored in self.counts
+        self.counts = np.zeros(0, dtype=np.int64)
+
+        if vmin is not None and vmax is not None:
+            self.set_range(vmin, vmax)
+
+    def has_range(self):
+        return self.origin is not None
+
+    def set_range(self, vmin, vmax):
+        if np.isfinite(vmin) and np.isfinite(vmax):
+            self.origin = float(vmin)
+            self.stop = float(vmax)
+            self.step = (self.stop - self.origin) / self.size
+            self.offset = 0
+            self.counts = np.zeros(self.size, dtype=np.int64)
+
+    def get_edges(self, indexes):
+        # compute the edges like np.linspace, so that the bins match np.histogram
+        return indexes * self.step + self.origin
+
+    def get_indexes(self, values):
+        # compute the bin indexes with fixed width bins and correct them at the edges, like np.histogram does
+        indexes = np.floor((values - self.origin) / self.step).astype(np.int64)
+        indexes[values < self.get_edges(indexes)] -= 1
+        indexes[values >= self.get_edges(indexes + 1)] += 1
+
+        # the right edge of the initial range belongs to the last bin of this range
+        indexes[(indexes >= self.size) & (values <= self.stop)] = self.size - 1
+        return indexes
+
+    def extend(self, index_min, index_max):
+        # grow the stored counts to include the bins from index_min to index_max, the existing bins stay valid
+        start = min(self.offset, index_min)
+        stop = max(self.offset + self.counts.size, index_max + 1)
+        if start < self.offset or stop > self.offset + self.counts.size:
+            counts = np.zeros(stop - start, dtype=np.int64)
+            counts[self.offset - start:self.offset - start + self.counts.size] = self.counts
+            self.offset, self.counts = start, counts
+
+    def add(self, values):
+        values = np.asarray(values, dtype=np.float64).ravel()
+        values = values[np.isfinite(values)]
+
+        if values.size > 0:
+            if not self.has_range():
+                self.set_range(values.min(), values.max())
+
+            if self.step == 0:
+                if (values == self.origin).all():
+                    # for a single value, all values are in the last bin, like in np.histogram
+                    self.counts[-1] += values.size
+                    return
+                else:
+                    # set a proper range and move the counts of the single value to the new bins
+                    value, count = self.origin, self.counts.sum()
+                    self.set_range(min(value, values.min()), max(value, values.max()))
+                    self.counts[self.get_indexes(np.array([value]))] += count
+
+            indexes = self.get_indexes(values)
+            self.extend(indexes.min(), indexes.max())
+            self.counts += np.bincount(indexes - self.offset, minlength=self.counts.size)
+
+    def merge(self, other):
+        if not other.has_range():
+            return
+        elif not self.has_range():
+            self.origin, self.step, self.stop = other.origin, other.step, other.stop
+            self.offset, self.counts = other.offset, other.counts.copy()
+            return
+        elif (self.origin, self.step, self.stop) != (other.origin, other.step, other.stop):
+            raise ValueError('Only histograms with the same bins can be merged.')
+
+        self.extend(other.offset, other.offset + other.counts.size - 1)
+        start = other.offset - self.offset
+        self.counts[start:start + other.counts.size] += other.counts
+
+    def to_df(self):
+        if self.has_range():
+            bins = self.get_edges(np.arange(self.offset, self.offset + self.counts.size))
+        else:
+            bins = np.zeros(0, dtype=np.float64)
+
+        return pd.DataFrame(data={
+            'count': self.counts
+        }, index=pd.Index(bins, name='bin'), dtype=np.int64)
+
+
+class Aggregate:
+
+    def __init__(self):
+        self.count = None  # number of values in each group
+        self.mean = None   # mean of the values in each group
+        self.m2 = None     # sum of the squared differences from the mean in each group
+
+    def add(self, df, keys):
+        grouped = df.groupby(keys)
+        count = grouped.count()
+        mean = grouped.mean().fillna(0)
+        m2 = (grouped.var(ddof=0) * count).fillna(0)
+
+        if self.count is None:
+            self.count, self.mean, self.m2 = count, mean, m2
+        else:
+            # combine the groups like in the parallel algorithm for the variance
+            index = self.count.index.union(count.index)
+            count_a, count_b = self.count.reindex(index, fill_value=0), count.reindex(index, fill_value=0)
+            mean_a, mean_b = self.mean.reindex(index, fill_value=0), mean.reindex(index, fill_value=0)
+            m2_a, m2_b = self.m2.reindex(index, fill_value=0), m2.reindex(index, fill_value=0)
+
+            self.count = count_a + count_b
+            delta = mean_b - mean_a
+            weight = (count_b / self.count).fillna(0)
+            self.mean = mean_a + delta * weight
+            self.m2 = m2_a + m2_b + delta ** 2 * count_a * weight
+
+    def to_df(self):
+        # the standard deviation is computed with ddof=1, like in pandas
+        mean = self.mean.where(self.count > 0)
+        std = np.sqrt(self.m2 / (self.count - 1)).where(self.count > 1)
+        return pd.concat([
+            mean,
+            std.add_suffix('_std'),
+            self.count.add_suffix('_count')
+        ], axis=1)
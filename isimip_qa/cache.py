@@ -0,0 +1,66 @@
+import copy
+import json
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class ReadCache:
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.entries = OrderedDict()  # entries (version, value, size) for the files, the last one was used last
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, store, path, read, name=None):
+        # return the parsed content of a file, which is only read again if the file has changed,
+        # the name distinguishes different representations of the same file
+        try:
+            version = store.get_version(path)
+        except FileNotFoundError:
+            return read()
+
+        key = (path, name)
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] == version:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            value = entry[1]
+        else:
+            self.misses += 1
+            value = read()
+            self.add(key, version, value)
+
+        # the callers may change the value
+        return copy.deepcopy(value)
+
+    def add(self, key, version, value):
+        self.remove(key)
+
+        size = get_size(value)
+        if size <= self.max_size:
+            self.entries[key] = (version, value, size)
+            self.size += size
+
+            while self.size > self.max_size:
+                self.remove(next(iter(self.entries)))
+
+    def remove(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry[2]
+
+    def log(self):
+        logger.info(f'read cache: {self.hits} hits, {self.misses} misses, {self.size / 1024 / 1024:.1f} MB')
+
+
+def get_size(value):
+    if hasattr(value, 'memory_usage'):
+        return int(value.memory_usage(deep=True, index=True).sum())
+    elif hasattr(value, 'nbytes'):
+        return int(value.nbytes)
+    else:
+        return len(json.dumps(value, default=str))
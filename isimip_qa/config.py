@@ -3,12 +3,12 @@ from collections import defaultdict
 from itertools import product
 from pathlib import Path
 
-import xarray as xr
-
 from isimip_utils.config import Settings as BaseSettings
 from isimip_utils.decorators import cached_property
 from isimip_utils.fetch import fetch_json
 
+from .cache import ReadCache
+
 
 class Settings(BaseSettings):
 
@@ -18,6 +18,18 @@ class Settings(BaseSettings):
         # create a dict to store masks
         self.MASKS = {}
 
+        # create a dict to store area weights for different grids
+        self.WEIGHTS = {}
+
+        # create a dict to store the open extraction stores
+        self.STORES = {}
+
+        # create a cache for the extractions, which are read by the plots
+        self.READ_CACHE = ReadCache(int(self.READ_CACHE_SIZE * 1024 * 1024))
+
+        # create a dict to store the digests of the extractions, which are hashed for the plots
+        self.DIGESTS = {}
+
     @cached_property
     def PATHS(self):
         paths = self.args.get('PATHS')
@@ -72,6 +84,10 @@ class Settings(BaseSettings):
     def EXTRACTIONS_PATH(self):
         return Path(self.args['EXTRACTIONS_PATH']).expanduser() if self.args['EXTRACTIONS_PATH'] else Path.cwd()
 
+    @cached_property
+    def CACHE_PATH(self):
+        return Path(self.args['CACHE_PATH']).expanduser() if self.args.get('CACHE_PATH') else None
+
     @cached_property
     def PLOTS_PATH(self):
         return Path(self.args['PLOTS_PATH']).expanduser() if self.args['PLOTS_PATH'] else Path.cwd()
@@ -128,11 +144,49 @@ class Settings(BaseSettings):
     def PRIMARY(self):
         return self.args.get('PRIMARY').split(',') if self.args.get('PRIMARY') else []
 
+    @cached_property
+    def CHUNKS(self):
+        chunks_string = self.args.get('CHUNKS')
+        if chunks_string:
+            if chunks_string == 'auto':
+                return 'auto'
+            else:
+                chunks = {}
+                for chunk_string in chunks_string.split(','):
+                    dim, size = chunk_string.split('=')
+                    chunks[dim] = size if size == 'auto' else int(size)
+                return chunks
+
+    @cached_property
+    def JOBS(self):
+        return int(self.args.get('JOBS') or 1)
+
+    @cached_property
+    def PLOT_JOBS(self):
+        return int(self.args.get('PLOT_JOBS') or self.JOBS)
+
+    @cached_property
+    def FETCH_JOBS(self):
+        return int(self.args.get('FETCH_JOBS') or 1)
+
+    @cached_property
+    def FETCH_TTL(self):
+        return int(self.args.get('FETCH_TTL') or 0)
+
+    @cached_property
+    def FETCH_TIMEOUT(self):
+        return float(self.args.get('FETCH_TIMEOUT') or 0) or None
+
+    @cached_property
+    def READ_CACHE_SIZE(self):
+        return float(self.args.get('READ_CACHE_SIZE') or 0)
+
     @cached_property
     def GRIDAREA(self):
         if self.args.get('GRIDAREA'):
+            import xarray as xr
+
             ds = xr.load_dataset(self.args.get('GRIDAREA'))
-            ds = ds.isel(lon=0)
             return ds.cell_area
 
     @cached_property
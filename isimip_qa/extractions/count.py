@@ -1,28 +1,31 @@
 import logging
 
-from ..mixins import CSVExtractionMixin, RemoteExtractionMixin
+from ..mixins import AggregateExtractionMixin, RemoteExtractionMixin, TableExtractionMixin
 from ..models import Extraction
 
 logger = logging.getLogger(__name__)
 
 
-class CountExtraction(CSVExtractionMixin, RemoteExtractionMixin, Extraction):
+class CountExtraction(AggregateExtractionMixin, TableExtractionMixin, RemoteExtractionMixin, Extraction):
 
     specifier = 'count'
     region_types = ['global', 'mask']
+    resume_type = 'series'
 
     def extract(self, file):
         logger.info(f'extract {self.region.specifier} {self.specifier} from {file.path}')
 
-        ds = file.ds
+        ds = self.select_period(file)
 
-        if self.period.type == 'slice':
-            ds = ds.sel(time=slice(self.period.start_date, self.period.end_date))
+        if self.region.stack is not None and self.region.stack.has_grid(ds):
+            # count the values for all regions of the stack at once
+            ds = self.region.stack.count(file, self.period, ds).sel(region=self.region.specifier, drop=True)
+        else:
+            ds = self.select_region(file).count(dim=('lat', 'lon'))
 
-        if self.region.type == 'mask':
-            ds = ds.where(self.region.mask == 1)
-
-        ds = ds.count(dim=('lat', 'lon'))
+        # the dataframe is used for the extraction and for the aggregates
+        df = self.get_df(ds)
 
         logger.info(f'write {self.path}')
-        self.write(ds, append=not file.first)
+        self.write(df, append=not self.is_first(file), flush=file.last)
+        self.aggregate(df[list(ds.data_vars)])
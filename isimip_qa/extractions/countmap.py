@@ -1,30 +1,40 @@
 import logging
 
-from ..mixins import CSVExtractionMixin, RemoteExtractionMixin
+from ..mixins import MapExtractionMixin, RemoteExtractionMixin, TableExtractionMixin
 from ..models import Extraction
+from ..utils import get_map_arrays, get_map_dataset
 
 logger = logging.getLogger(__name__)
 
 
-class CountMapExtraction(CSVExtractionMixin, RemoteExtractionMixin, Extraction):
+class CountMapExtraction(MapExtractionMixin, TableExtractionMixin, RemoteExtractionMixin, Extraction):
 
     specifier = 'countmap'
     region_types = ['global', 'mask']
 
+    def restore(self):
+        # continue with the existing map, where the cells without values have a count of 0
+        self.ds = self.read().set_index(['lat', 'lon']).to_xarray().fillna(0)
+
+    def get_checkpoint(self):
+        try:
+            return get_map_arrays(self.ds)
+        except AttributeError:
+            return {}
+
+    def set_checkpoint(self, arrays):
+        if arrays:
+            self.ds = get_map_dataset(arrays)
+
     def extract(self, file):
         logger.info(f'extract {self.region.specifier} {self.specifier} from {file.path}')
 
-        ds = file.ds
-
-        if self.period.type == 'slice':
-            ds = ds.sel(time=slice(self.period.start_date, self.period.end_date))
+        ds = self.select_period(file)
 
         if ds.time.size > 0:
+            ds = self.select_region(file)
 
-            if self.region.type == 'mask':
-                ds = ds.where(self.region.mask == 1)
-
-            ds = ds.count(dim=('time',))
+            ds = ds.count(dim=('time',)).compute()
 
             try:
                 self.ds += ds
@@ -32,6 +42,9 @@ class CountMapExtraction(CSVExtractionMixin, RemoteExtractionMixin, Extraction):
                 self.ds = ds
 
         if file.last:
+            # the map of a mask region only covers its bounding box, so it is expanded to the full grid
+            self.ds = self.ds.reindex(lat=file.ds.lat, lon=file.ds.lon)
+
             # only consider values > 0
             self.ds = self.ds.where(self.ds > 0)
 
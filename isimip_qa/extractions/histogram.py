@@ -1,63 +1,89 @@
 import logging
 
+import dask
 import numpy as np
-import pandas as pd
 
-from ..mixins import CSVExtractionMixin, RemoteExtractionMixin
+from ..accumulators import Histogram
+from ..mixins import RemoteExtractionMixin, TableExtractionMixin
 from ..models import Extraction
+from ..utils import iter_time_chunks
 
 logger = logging.getLogger(__name__)
 
 
-class HistogramExtraction(CSVExtractionMixin, RemoteExtractionMixin, Extraction):
+class HistogramExtraction(TableExtractionMixin, RemoteExtractionMixin, Extraction):
 
     specifier = 'histogram'
     region_types = ['global', 'mask', 'point']
 
+    def restore(self):
+        # continue with the counts of the existing histogram
+        self.set_histogram(self.read()['count'].to_numpy(dtype=np.int64))
+
+    def get_state(self):
+        try:
+            histogram = self.histogram
+        except AttributeError:
+            return {}
+
+        return {
+            'origin': histogram.origin,
+            'step': histogram.step,
+            'stop': histogram.stop,
+            'offset': int(histogram.offset)
+        }
+
+    def get_checkpoint(self):
+        try:
+            return {'counts': self.histogram.counts}
+        except AttributeError:
+            return {}
+
+    def set_checkpoint(self, arrays):
+        if arrays:
+            self.set_histogram(arrays['counts'])
+
+    def set_histogram(self, counts):
+        # the bins of the histogram are taken from the manifest
+        histogram = self.histogram = Histogram()
+        if self.manifest.state.get('origin') is not None:
+            histogram.origin = self.manifest.state['origin']
+            histogram.step = self.manifest.state['step']
+            histogram.stop = self.manifest.state['stop']
+            histogram.offset = self.manifest.state['offset']
+            histogram.counts = counts
+
     def extract(self, file):
         logger.info(f'extract {self.region.specifier} {self.specifier} from {file.path}')
 
-        ds = file.ds
-
-        if self.period.type == 'slice':
-            ds = ds.sel(time=slice(self.period.start_date, self.period.end_date))
+        ds = self.select_period(file)
 
         if ds.time.size > 0:
-
-            if self.region.type == 'mask':
-                ds = ds.where(self.region.mask == 1)
-            elif self.region.type == 'point':
-                ds = ds.sel(lat=self.region.lat, lon=self.region.lon, method='nearest')
+            ds = self.select_region(file)
 
             var = next(iter(file.ds.data_vars.values()))
-            array = ds[var.name].as_numpy()
-            array_min = array.min().values
-            array_max = array.max().values
+            array = ds[var.name]
+            if array.chunks is None:
+                # without chunks, read the array only once
+                array = array.as_numpy()
 
             try:
-                # if the range of the file extends the range of the stored histogram,
-                # the range needs to be extended using the same step size
-                step = self.bins[1] - self.bins[0]
-                if array_min < self.bins[0]:
-                    extension = np.arange(self.bins[0] - step, array_min, step, dtype=np.float64)
-                    self.bins = np.concatenate((extension, self.bins))
-                if array_max > self.bins[-1]:
-                    extension = np.arange(self.bins[-1] + step, array_max, step, dtype=np.float64)
-                    self.bins = np.concatenate((self.bins, extension))
+                histogram = self.histogram
             except AttributeError:
-                self.bins = np.linspace(array_min, array_max, num=101, endpoint=True, dtype=np.float64)
+                # the range of the first file sets the bins, so that the histogram does not depend on
+                # the chunks, the bins are extended with the same step size for values outside of this range
+                if array.size > 0:
+                    array_min, array_max = (value.item() for value in dask.compute(array.min(), array.max()))
+                else:
+                    # the bounding box of an empty mask has no cells
+                    array_min, array_max = np.nan, np.nan
 
-            histogram = np.histogram(array, bins=self.bins)
+                histogram = self.histogram = Histogram(array_min, array_max)
 
-            df = pd.DataFrame(data={
-                'count': histogram[0]
-            }, index=pd.Index(histogram[1][:-1], name='bin'), dtype=np.int64)
-
-            try:
-                self.df = self.df.reindex(df.index, fill_value=0) + df
-            except AttributeError:
-                self.df = df
+            # compute the histogram chunk by chunk in a single pass
+            for chunk in iter_time_chunks(array):
+                histogram.add(chunk.values)
 
         if file.last:
             logger.info(f'write {self.path}')
-            self.write(self.df)
+            self.write(self.histogram.to_df())
@@ -1,38 +1,54 @@
 import logging
 
-import numpy as np
+import xarray as xr
 
-from ..mixins import CSVExtractionMixin, RemoteExtractionMixin
+from ..mixins import AggregateExtractionMixin, RemoteExtractionMixin, TableExtractionMixin
 from ..models import Extraction
+from ..utils import get_weights
 
 logger = logging.getLogger(__name__)
 
 
-class MeanExtraction(CSVExtractionMixin, RemoteExtractionMixin, Extraction):
+class MeanExtraction(AggregateExtractionMixin, TableExtractionMixin, RemoteExtractionMixin, Extraction):
 
     specifier = 'mean'
     region_types = ['global', 'mask', 'point']
 
+    @property
+    def resume_type(self):
+        # the time series of a point is written at once and can only be continued
+        return 'append' if self.region.type == 'point' else 'series'
+
     def extract(self, file):
         logger.info(f'extract {self.region.specifier} {self.specifier} from {file.path}')
 
-        ds = file.ds
-
-        if self.period.type == 'slice':
-            ds = ds.sel(time=slice(self.period.start_date, self.period.end_date))
+        ds = self.select_period(file)
 
         if self.region.type == 'point':
-            ds = ds.sel(lat=self.region.lat, lon=self.region.lon, method='nearest')
+            ds = self.select_region(file)
         else:
-            if self.region.type == 'mask':
-                ds = ds.where(self.region.mask == 1)
-
-            if self.gridarea is None:
-                weights = np.sin(np.deg2rad(ds.lat + 0.25)) - np.sin(np.deg2rad(ds.lat - 0.25))
+            if self.region.stack is not None and self.region.stack.has_grid(ds):
+                # compute the means for all regions of the stack at once
+                weights = get_weights(ds, self.gridarea)
+                ds = self.region.stack.mean(file, self.period, ds, weights).sel(region=self.region.specifier, drop=True)
             else:
-                weights = self.gridarea
+                weights = get_weights(ds, self.gridarea, self.region)
+                ds = self.select_region(file).weighted(weights).mean(dim=('lat', 'lon'), skipna=True)
 
-            ds = ds.weighted(weights).mean(dim=('lat', 'lon'), skipna=True)
+        # the dataframe is used for the extraction and for the aggregates
+        df = self.get_df(ds)
+        self.aggregate(df[list(ds.data_vars)])
 
-        logger.info(f'write {self.path}')
-        self.write(ds, append=not file.first)
+        if self.region.type == 'point':
+            # the time series of a point is small, so it is collected and written once after the last file
+            try:
+                self.datasets.append(ds)
+            except AttributeError:
+                self.datasets = [ds]
+
+            if file.last:
+                logger.info(f'write {self.path}')
+                self.write(xr.concat(self.datasets, dim='time'), append=self.resumed, flush=True)
+        else:
+            logger.info(f'write {self.path}')
+            self.write(df, append=not self.is_first(file), flush=file.last)
@@ -1,30 +1,48 @@
 import logging
 
-from ..mixins import CSVExtractionMixin, RemoteExtractionMixin
+from ..mixins import MapExtractionMixin, RemoteExtractionMixin, TableExtractionMixin
 from ..models import Extraction
+from ..utils import get_map_arrays, get_map_dataset
 
 logger = logging.getLogger(__name__)
 
 
-class MeanMapExtraction(CSVExtractionMixin, RemoteExtractionMixin, Extraction):
+class MeanMapExtraction(MapExtractionMixin, TableExtractionMixin, RemoteExtractionMixin, Extraction):
 
     specifier = 'meanmap'
     region_types = ['global', 'mask']
 
+    def restore(self):
+        # continue with the sum of the existing map, using the count from the manifest
+        self.count = self.manifest.state['count']
+        self.ds = self.read().set_index(['lat', 'lon']).to_xarray() * self.count
+
+    def get_state(self):
+        try:
+            return {'count': self.count}
+        except AttributeError:
+            return {}
+
+    def get_checkpoint(self):
+        try:
+            return get_map_arrays(self.ds)
+        except AttributeError:
+            return {}
+
+    def set_checkpoint(self, arrays):
+        if arrays:
+            self.ds = get_map_dataset(arrays)
+            self.count = self.manifest.state['count']
+
     def extract(self, file):
         logger.info(f'extract {self.region.specifier} {self.specifier} from {file.path}')
 
-        ds = file.ds
-
-        if self.period.type == 'slice':
-            ds = ds.sel(time=slice(self.period.start_date, self.period.end_date))
+        ds = self.select_period(file)
 
         if ds.time.size > 0:
+            ds = self.select_region(file)
 
-            if self.region.type == 'mask':
-                ds = ds.where(self.region.mask == 1)
-
-            ds = ds.sum(dim=('time',), skipna=True, min_count=1)
+            ds = ds.sum(dim=('time',), skipna=True, min_count=1).compute()
 
             try:
                 self.ds += ds
@@ -37,5 +55,8 @@ class MeanMapExtraction(CSVExtractionMixin, RemoteExtractionMixin, Extraction):
             # devide sum by count to get mean
             self.ds /= self.count
 
+            # the map of a mask region only covers its bounding box, so it is expanded to the full grid
+            self.ds = self.ds.reindex(lat=file.ds.lat, lon=file.ds.lon)
+
             logger.info(f'write {self.path}')
             self.write(self.ds)
@@ -0,0 +1,268 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+import zipfile
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+# the session keeps the connections to the locations alive between the requests
+session = requests.Session()
+
+
+class FetchCache:
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        try:
+            self.entries = json.loads((self.path / 'index.json').read_text())
+        except FileNotFoundError:
+            self.entries = {}
+
+    def get_headers(self, url):
+        # return None if the url is known to be missing, or the headers for a conditional request
+        entry = self.entries.get(url)
+        if entry is None:
+            return {}
+        elif entry['status'] == 404:
+            if time.time() - entry['time'] < settings.FETCH_TTL:
+                return None
+            else:
+                return {}
+        elif not self.get_content_path(url).exists():
+            # the content was removed from the cache, so the validators cannot be used
+            return {}
+        else:
+            headers = {}
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+            return headers
+
+    def get_content_path(self, url):
+        return self.path / hashlib.sha1(url.encode()).hexdigest()
+
+    def read(self, url):
+        return self.get_content_path(url).read_bytes()
+
+    def add(self, url, response, content=True):
+        entry = {'status': response.status_code, 'time': time.time()}
+        if response.status_code == 200 and content:
+            entry['etag'] = response.headers.get('ETag')
+            entry['last_modified'] = response.headers.get('Last-Modified')
+
+            content_path = self.get_content_path(url)
+            tmp_path = content_path.with_name(f'{content_path.name}.{threading.get_ident()}')
+            tmp_path.write_bytes(response.content)
+            tmp_path.replace(content_path)
+
+        with self.lock:
+            self.entries[url] = entry
+
+    def count(self, hit):
+        with self.lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def save(self):
+        index_path = self.path / 'index.json'
+        tmp_path = index_path.with_name(f'index.json.{os.getpid()}')
+        tmp_path.write_text(json.dumps(self.entries))
+        tmp_path.replace(index_path)
+
+
+def fetch_file(bases, path, cache=None, fp=None):
+    # with fp, the content is streamed to this file instead of being returned, and it is not stored in the cache
+    for base in bases:
+        if urlparse(base).scheme:
+            file_url = base.rstrip('/') + '/' + path.as_posix()
+            logger.debug('file_url = %s', file_url)
+
+            headers = cache.get_headers(file_url) if cache else {}
+            if headers is None:
+                # the file was not found recently, so it is not requested again
+                cache.count(hit=True)
+                continue
+
+            try:
+                response = session.get(file_url, headers=headers, timeout=settings.FETCH_TIMEOUT,
+                                       stream=fp is not None)
+                if response.status_code == 304:
+                    try:
+                        file_content = cache.read(file_url)
+                    except FileNotFoundError:
+                        # the content was removed in the meantime, so the file is requested again without validators
+                        response = session.get(file_url, timeout=settings.FETCH_TIMEOUT)
+                    else:
+                        cache.count(hit=True)
+                        return file_content
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                # try the next location
+                logger.warning('could not fetch %s (%s)', file_url, e.__class__.__name__)
+                continue
+
+            if cache and response.status_code in [200, 404]:
+                cache.count(hit=False)
+                cache.add(file_url, response, content=fp is None)
+
+            if response.status_code == 200:
+                if fp is None:
+                    return response.content
+
+                try:
+                    fp.seek(0)
+                    fp.truncate()
+                    for chunk in response.iter_content(chunk_size=1024 * 1024):
+                        fp.write(chunk)
+                except (requests.exceptions.ConnectionError, requests.exceptions.ChunkedEncodingError,
+                        requests.exceptions.Timeout) as e:
+                    logger.warning('could not fetch %s (%s)', file_url, e.__class__.__name__)
+                    continue
+
+                return fp
+
+        else:
+            file_path = Path(base).expanduser() / path
+            logger.debug('file_path = %s', file_path)
+
+            if file_path.exists():
+                if fp is None:
+                    return file_path.read_bytes()
+
+                with file_path.open('rb') as src:
+                    shutil.copyfileobj(src, fp)
+                return fp
+
+
+def probe_file(bases, path, cache=None):
+    for base in bases:
+        if urlparse(base).scheme:
+            file_url = base.rstrip('/') + '/' + path.as_posix()
+            logger.debug('file_url = %s', file_url)
+
+            if cache and cache.get_headers(file_url) is None:
+                continue
+
+            try:
+                response = session.head(file_url, timeout=settings.FETCH_TIMEOUT)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                logger.warning('could not probe %s (%s)', file_url, e.__class__.__name__)
+                continue
+
+            if response.status_code == 200:
+                return True
+
+        else:
+            file_path = Path(base).expanduser() / path
+            logger.debug('file_path = %s', file_path)
+
+            if file_path.exists():
+                return True
+
+    return False
+
+
+def fetch_bundle(dataset, cache=None):
+    # the bundle is a zip file with all extractions of a dataset, its central directory is used as index,
+    # the bundles are large, so they are written to a temporary file, which is removed when it is closed,
+    # and only missing bundles are stored in the cache
+    path = dataset.path.with_name(dataset.path.name + '.zip')
+    fp = tempfile.TemporaryFile()
+    if fetch_file(settings.EXTRACTIONS_LOCATIONS, path, cache=cache, fp=fp) is not None:
+        try:
+            bundle = zipfile.ZipFile(fp)
+        except zipfile.BadZipFile:
+            logger.warning('could not open bundle %s', path)
+        else:
+            logger.info('fetch bundle %s', path)
+            return bundle
+
+    fp.close()
+
+
+def get_cache():
+    if settings.CACHE_PATH:
+        path = settings.CACHE_PATH / 'fetch'
+        if not settings.PLAN:
+            # the plan only reads the cache
+            path.mkdir(exist_ok=True, parents=True)
+        return FetchCache(path)
+
+
+def mount_adapter():
+    # one pooled connection per thread
+    adapter = HTTPAdapter(pool_connections=settings.FETCH_JOBS, pool_maxsize=settings.FETCH_JOBS)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+
+
+def probe_extractions(extractions):
+    if not settings.EXTRACTIONS_LOCATIONS:
+        return [False for extraction in extractions]
+
+    # the cache is only used to skip files which are known to be missing
+    cache = get_cache()
+    mount_adapter()
+
+    with ThreadPoolExecutor(max_workers=settings.FETCH_JOBS) as executor:
+        return list(executor.map(lambda extraction: extraction.probe(cache), extractions))
+
+
+def fetch_extractions(extractions):
+    if not settings.EXTRACTIONS_LOCATIONS:
+        return
+
+    cache = get_cache()
+    mount_adapter()
+
+    dataset_extractions = defaultdict(list)
+    for extraction in extractions:
+        dataset_extractions[extraction.dataset].append(extraction)
+
+    # download concurrently, but write to the stores in the main thread
+    with ThreadPoolExecutor(max_workers=settings.FETCH_JOBS) as executor:
+        # try the bundles of the datasets first, the extractions are only read from the bundle when needed
+        remaining_extractions = []
+        bundle_futures = {executor.submit(fetch_bundle, dataset, cache): dataset for dataset in dataset_extractions}
+        for future in as_completed(bundle_futures):
+            bundle = future.result()
+            for extraction in dataset_extractions[bundle_futures.pop(future)]:
+                path, file_content = extraction.unpack(bundle) if bundle else (None, None)
+                if file_content is not None:
+                    extraction.fetch((path, file_content))
+                else:
+                    remaining_extractions.append(extraction)
+
+            if bundle:
+                # each bundle is closed after use, this also removes its temporary file
+                bundle.fp.close()
+                bundle.close()
+
+        # fall back to the single files for the remaining extractions
+        futures = [executor.submit(extraction.download, cache) for extraction in remaining_extractions]
+        for extraction, future in zip(remaining_extractions, futures):
+            extraction.fetch(future.result())
+
+    if cache:
+        cache.save()
+        logger.info(f'fetch cache: {cache.hits} hits, {cache.misses} misses')
@@ -0,0 +1,135 @@
+import io
+import tempfile
+from itertools import chain
+from pathlib import Path
+
+import netCDF4
+import pandas as pd
+import xarray as xr
+
+
+def get_index(df):
+    # the index of a table extraction, which is stored as columns
+    for index in [['time'], ['bin'], ['year', 'month'], ['year'], ['dayofyear']]:
+        if all(name in df for name in index):
+            return index
+
+    return ['lon', 'lat']
+
+
+def reset_index(df):
+    return df if df.index.names == [None] else df.reset_index()
+
+
+class CSVFormat:
+
+    suffix = '.csv'
+    appendable = True
+
+    def write(self, store, path, df, append=False, key=None):
+        index = df.index.names != [None]
+        if append:
+            store.append(path, df.to_csv(header=False, index=index).encode())
+        else:
+            store.write(path, df.to_csv(index=index).encode(), key=key)
+
+    def read(self, store, path):
+        return pd.read_csv(io.BytesIO(store.read(path)))
+
+    def read_rows(self, store, path):
+        # the rows are kept as lines, so that they are written back unchanged
+        lines = store.read(path).decode().splitlines(keepends=True)
+        return lines[0], lines[1:]
+
+    def write_rows(self, store, path, header, blocks):
+        store.write(path, ''.join(chain([header], *blocks)).encode())
+
+
+class DataFrameFormat:
+
+    # the binary formats cannot be appended to, so appending rows needs to read and write the whole file
+    appendable = False
+
+    def write(self, store, path, df, append=False, key=None):
+        df = reset_index(df)
+        if append:
+            df = pd.concat([self.read(store, path), df], ignore_index=True)
+
+        store.write(path, self.dump(df), key=key)
+
+    def read(self, store, path):
+        return self.load(store.read(path))
+
+    def read_rows(self, store, path):
+        return None, self.read(store, path)
+
+    def write_rows(self, store, path, header, blocks):
+        self.write(store, path, pd.concat(blocks, ignore_index=True))
+
+    def dump(self, df):
+        raise NotImplementedError
+
+    def load(self, data):
+        raise NotImplementedError
+
+
+class ParquetFormat(DataFrameFormat):
+
+    suffix = '.parquet'
+
+    def dump(self, df):
+        buffer = io.BytesIO()
+        df.to_parquet(buffer, index=False)
+        return buffer.getvalue()
+
+    def load(self, data):
+        return pd.read_parquet(io.BytesIO(data))
+
+
+class FeatherFormat(DataFrameFormat):
+
+    suffix = '.feather'
+
+    def dump(self, df):
+        buffer = io.BytesIO()
+        df.to_feather(buffer)
+        return buffer.getvalue()
+
+    def load(self, data):
+        return pd.read_feather(io.BytesIO(data))
+
+
+class NetCDFFormat(DataFrameFormat):
+
+    suffix = '.nc'
+
+    def dump(self, df):
+        # maps are stored as arrays over lon and lat, in the original order of the coordinates
+        index = get_index(df)
+        if df.duplicated(index).any() or index == ['year', 'month']:
+            # e.g. the bins of a histogram of a single value or the months of each year, which are stored as rows
+            ds = df.to_xarray()
+        else:
+            ds = df.set_index(index).to_xarray()
+            ds = ds.reindex({name: pd.unique(df[name]) for name in index})
+
+        # the netcdf4 library can only write to files
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            tmp_path = Path(tmp_dir) / 'extraction.nc'
+            ds.to_netcdf(tmp_path)
+            return tmp_path.read_bytes()
+
+    def load(self, data):
+        # the in-memory dataset is closed together with the xarray dataset
+        nc = netCDF4.Dataset('extraction.nc', memory=data)
+        with xr.open_dataset(xr.backends.NetCDF4DataStore(nc)) as ds:
+            df = ds.to_dataframe()
+            return df.reset_index(drop=(df.index.names == ['index']))
+
+
+formats = {
+    'csv': CSVFormat(),
+    'parquet': ParquetFormat(),
+    'feather': FeatherFormat(),
+    'netcdf': NetCDFFormat()
+}
@@ -0,0 +1,69 @@
+import logging
+from concurrent.futures import ProcessPoolExecutor
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class RecordHandler(logging.Handler):
+
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        # render the message and the traceback now, so that the record can be pickled
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+
+        self.records.append(record)
+
+    def pop_records(self):
+        records, self.records = self.records, []
+        return records
+
+
+record_handler = RecordHandler()
+
+
+def init_worker(args):
+    settings.setup(args)
+
+    # buffer the log records in the worker, they are handled by the main process
+    # in the order of the tasks so that the log does not interleave
+    root_logger = logging.getLogger()
+    for handler in root_logger.handlers[:]:
+        root_logger.removeHandler(handler)
+    root_logger.addHandler(record_handler)
+
+
+def run_task(function, task):
+    try:
+        function(*task)
+        success = True
+    except Exception:
+        logger.exception(f'task {task} failed')
+        success = False
+
+    return success, record_handler.pop_records()
+
+
+def run_jobs(function, tasks, jobs=None):
+    # run the function for every task in a pool of settings.JOBS processes,
+    # the tasks need to be picklable and the function needs to be importable
+    failures = 0
+    with ProcessPoolExecutor(max_workers=jobs or settings.JOBS, initializer=init_worker,
+                             initargs=(settings.args, )) as executor:
+        futures = [executor.submit(run_task, function, task) for task in tasks]
+        for future in futures:
+            success, records = future.result()
+            for record in records:
+                logging.getLogger(record.name).handle(record)
+            if not success:
+                failures += 1
+
+    return failures
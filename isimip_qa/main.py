@@ -1,13 +1,18 @@
 import logging
+import sys
+from collections import defaultdict
 
 from isimip_utils.parser import ArgumentParser
 
 from . import __version__
 from .config import settings
-from .extractions import extraction_classes
-from .models import Dataset, Period, Region
+from .extractions import get_extraction_classes
+from .fetch import fetch_extractions
+from .jobs import run_jobs
 from .parser import ArgumentAction
-from .plots import plot_classes
+from .plan import get_plan, print_plan
+from .plots import get_plot_classes
+from .stores import get_store
 
 logger = logging.getLogger(__name__)
 
@@ -26,6 +31,9 @@ def get_parser():
                         help='Base path for the created extractions')
     parser.add_argument('--plots-path', dest='plots_path',
                         help='Base path for the created plots')
+    parser.add_argument('--cache-path', dest='cache_path', default=None,
+                        help='Base path for cached files, e.g. compiled masks or fetched extractions '
+                             '[default: no cache]')
 
     parser.add_argument('--extractions', dest='extractions', default=None,
                         help='Run only specific extractions (comma seperated)')
@@ -38,16 +46,53 @@ def get_parser():
 
     parser.add_argument('-f', '--force', dest='force', action='store_true', default=False,
                         help='Always run extractions')
+    parser.add_argument('--force-plots', dest='force_plots', action='store_true', default=False,
+                        help='Always create plots, even if their extractions did not change')
     parser.add_argument('-l', '--load', dest='load', action='store_true', default=False,
                         help='Load NetCDF datasets completely in memory')
+    parser.add_argument('-c', '--chunks', dest='chunks', default=None,
+                        help='Read NetCDF datasets in chunks, e.g. time=365 or auto [default: no chunks]')
+    parser.add_argument('--checkpoint', type=int, dest='checkpoint', default=0,
+                        help='Write a checkpoint of running extractions every N files [default: 0, i.e. never]')
+    parser.add_argument('--resume', dest='resume', action='store_true', default=False,
+                        help='Resume interrupted extractions from their checkpoints')
+    parser.add_argument('--manifest-checksums', dest='manifest_checksums', action='store_true', default=False,
+                        help='Store checksums of the input files, so that touched files are not extracted again')
+    parser.add_argument('--plan', dest='plan', nargs='?', const='summary', default=None,
+                        choices=['summary', 'json'],
+                        help='Only print the extractions and plots which would be created, as summary or json')
+    parser.add_argument('-j', '--jobs', type=int, dest='jobs', default=1,
+                        help='Number of parallel processes for the extractions [default: 1]')
 
     parser.add_argument('--extractions-only', dest='extractions_only', action='store_true', default=False,
                         help='Only create extractions')
+    parser.add_argument('--extractions-format', dest='extractions_format', default='csv',
+                        choices=['csv', 'parquet', 'feather', 'netcdf'],
+                        help='File format for extractions [default: csv]')
+    parser.add_argument('--extractions-store', dest='extractions_store', action='store_true', default=False,
+                        help='Store the extractions of each dataset in one SQLite file')
+    parser.add_argument('--extractions-export', dest='extractions_export', action='store_true', default=False,
+                        help='Export the extractions from the SQLite files to separate files')
+    parser.add_argument('--cftime', dest='cftime', default=None,
+                        help='Read the time of extractions with cftime for this calendar, e.g. 360_day '
+                             '[default: numpy datetimes]')
     parser.add_argument('--extractions-locations', dest='extractions_locations',
                         default='https://files.isimip.org/qa/extractions/',
                         help='URL or file path to the locations of extractions to fetch')
+    parser.add_argument('--fetch-jobs', type=int, dest='fetch_jobs', default=8,
+                        help='Number of parallel downloads of extractions [default: 8]')
+    parser.add_argument('--fetch-ttl', type=int, dest='fetch_ttl', default=86400,
+                        help='Time in seconds before missing extractions are requested again, '
+                             'only used with --cache-path [default: 86400]')
+    parser.add_argument('--fetch-timeout', type=float, dest='fetch_timeout', default=30,
+                        help='Time in seconds to wait for a location before the next one is tried [default: 30]')
     parser.add_argument('--plots-only', dest='plots_only', action='store_true', default=False,
                         help='Only create plots')
+    parser.add_argument('--plot-jobs', type=int, dest='plot_jobs', default=None,
+                        help='Number of parallel processes for the plots [default: same as --jobs]')
+    parser.add_argument('--read-cache-size', type=float, dest='read_cache_size', default=256,
+                        help='Maximum size in MB of the extractions which are kept in memory for the plots '
+                             '[default: 256]')
     parser.add_argument('--plots-format', dest='plots_format', default='svg',
                         help='File format for plots [default: svg].')
     parser.add_argument('--primary', dest='primary', default=None,
@@ -70,6 +115,8 @@ def get_parser():
                         help='Fixed maximum colormap value for maps.')
     parser.add_argument('--cmap', dest='cmap', default='viridis',
                         help='Colormap to use for maps.')
+    parser.add_argument('--map-decimation', dest='map_decimation', action='store_true', default=False,
+                        help='Reduce maps to the resolution of the figure using block means.')
 
     parser.add_argument('--row-ranges', dest='row_ranges', action='store_true', default=False,
                         help='Compute seperate plot ranges for each row.')
@@ -99,60 +146,226 @@ def init_settings(config_file=None, **kwargs):
     return settings
 
 
+def get_regions():
+    from .models import PointStack, Region, RegionStack
+
+    regions = [Region(**region) for region in settings.REGIONS]
+
+    # stack the mask regions from the same mask file, so that they can be reduced in one pass
+    mask_regions = defaultdict(list)
+    for region in regions:
+        if region.type == 'mask':
+            mask_regions[region.mask_path].append(region)
+
+    for stack_regions in mask_regions.values():
+        if len(stack_regions) > 1:
+            RegionStack(stack_regions)
+
+    # stack the point regions, so that they are selected together
+    point_regions = [region for region in regions if region.type == 'point']
+    if len(point_regions) > 1:
+        PointStack(point_regions)
+
+    # the masks are compiled now, so their files can be closed
+    for mask in settings.MASKS.values():
+        mask.close()
+
+    return regions
+
+
+def get_extractions(dataset, regions, periods):
+    extractions = []
+    for region in regions:
+        for period in periods:
+            for extraction_class in get_extraction_classes(settings.EXTRACTIONS):
+                if (
+                    extraction_class.has_region(region)
+                    and extraction_class.has_period(period)
+                ):
+                    extractions.append(extraction_class(dataset, region, period, gridarea=settings.GRIDAREA))
+
+    return extractions
+
+
+def get_plots(datasets, regions, periods):
+    plots = []
+    for plot_class in get_plot_classes(settings.PLOTS):
+        for region in regions:
+            for period in periods:
+                for extraction_class in get_extraction_classes(settings.EXTRACTIONS):
+                    if (
+                        plot_class.has_extraction(extraction_class)
+                        and extraction_class.has_region(region)
+                        and extraction_class.has_period(period)
+                    ):
+                        plots.append(plot_class(extraction_class, datasets, region, period,
+                                                path=settings.PATHS[0].stem, dimensions=settings.PLACEHOLDERS,
+                                                grid=settings.GRID, figs=settings.FIGS))
+
+    return plots
+
+
+def extract_dataset(dataset, regions, periods):
+    # the missing extractions were fetched before, if possible
+    extractions = []
+    for extraction in get_extractions(dataset, regions, periods):
+        if settings.FORCE or not extraction.exists():
+            if settings.RESUME:
+                # continue an interrupted extraction from its checkpoint
+                extraction.files = extraction.resume_checkpoint(dataset.files)
+            else:
+                extraction.files = dataset.files
+        else:
+            # only extract the files which are new or changed since the last run
+            extraction.files = extraction.resume(dataset.files)
+
+        # a resumed extraction needs to be finished, even if only files were removed
+        if extraction.files or extraction.resumed:
+            extractions.append(extraction)
+
+    if extractions:
+        # if at least one extraction is not complete, perform extractions file by file
+        for file in dataset.files:
+            file_extractions = [extraction for extraction in extractions if file in extraction.files]
+            if file_extractions:
+                file.open()
+                for extraction in file_extractions:
+                    extraction.extract(file)
+                    extraction.record(file)
+
+                    if (
+                        settings.CHECKPOINT and not file.last
+                        and len(extraction.manifest.files) % settings.CHECKPOINT == 0
+                    ):
+                        extraction.checkpoint()
+                file.close()
+
+        for extraction in extractions:
+            extraction.finish(dataset.files)
+
+
+def get_job_regions():
+    # in the worker processes, the regions are created from the settings, but only once for all tasks
+    try:
+        return settings.JOB_REGIONS
+    except AttributeError:
+        regions = settings.JOB_REGIONS = get_regions()
+        return regions
+
+
+def extract_dataset_job(dataset_path):
+    from .models import Dataset, Period
+
+    # in the worker processes, the dataset and the periods are created from the settings
+    dataset = Dataset(dataset_path)
+    periods = [Period(**period) for period in settings.PERIODS]
+    extract_dataset(dataset, get_job_regions(), periods)
+
+
+def get_plot(plot_key):
+    from .models import Dataset, Period
+
+    # in the worker processes, the plots are created from the settings, but only once for all tasks
+    try:
+        plots = settings.PLOT_KEYS
+    except AttributeError:
+        datasets = [Dataset(path) for path in settings.DATASETS]
+        regions = get_regions()
+        periods = [Period(**period) for period in settings.PERIODS]
+        plots = settings.PLOT_KEYS = {plot.key: plot for plot in get_plots(datasets, regions, periods)}
+
+    return plots[plot_key]
+
+
+def create_plot_job(plot_key):
+    import matplotlib
+
+    # in the worker processes, the plots are rendered without a display
+    matplotlib.use('Agg')
+
+    get_plot(plot_key).create()
+
+    settings.READ_CACHE.log()
+
+
 def main():
     parser = get_parser()
     args = vars(parser.parse_args())
     settings.setup(args)
 
+    # the models import numpy and xarray, so they are only imported after the arguments are parsed
+    from .models import Dataset, Period
+
     # create list of datasets
     datasets = [Dataset(path) for path in settings.DATASETS]
 
     # create list of regions and periods
-    regions = [Region(**region) for region in settings.REGIONS]
+    regions = get_regions()
     periods = [Period(**period) for period in settings.PERIODS]
 
+    if settings.PLAN:
+        # print the work without reading or writing any data
+        print_plan(get_plan(
+            [] if settings.PLOTS_ONLY else [
+                extraction
+                for dataset in datasets
+                for extraction in get_extractions(dataset, regions, periods)
+            ],
+            [] if settings.EXTRACTIONS_ONLY else get_plots(datasets, regions, periods)
+        ))
+
+        for store in settings.STORES.values():
+            store.close()
+        return
+
     # run the extractions
+    failures = 0
     if not settings.PLOTS_ONLY:
+        if not settings.FORCE:
+            # fetch the missing extractions of all datasets at once, so that the downloads run concurrently
+            fetch_extractions([
+                extraction
+                for dataset in datasets
+                for extraction in get_extractions(dataset, regions, periods)
+                if not extraction.exists()
+            ])
+
+        if settings.JOBS > 1:
+            # distribute the datasets over a pool of processes
+            failures = run_jobs(extract_dataset_job, [(path, ) for path in settings.DATASETS])
+        else:
+            for dataset in datasets:
+                extract_dataset(dataset, regions, periods)
+
+    if settings.EXTRACTIONS_STORE and settings.EXTRACTIONS_EXPORT:
         for dataset in datasets:
-            extractions = []
-            for region in regions:
-                for period in periods:
-                    for extraction_class in extraction_classes:
-                        if (
-                            (settings.EXTRACTIONS is None or extraction_class.specifier in settings.EXTRACTIONS)
-                            and extraction_class.has_region(region)
-                            and extraction_class.has_period(period)
-                        ):
-                            extraction = extraction_class(dataset, region, period, gridarea=settings.GRIDAREA)
-                            if settings.FORCE or (not extraction.exists() and not extraction.fetch()):
-                                extractions.append(extraction)
-
-            if extractions:
-                # if at least one extraction is not complete, perform extractions file by file
-                for file in dataset.files:
-                    file.open()
-                    for extraction in extractions:
-                        extraction.extract(file)
-                    file.close()
+            get_store(dataset).export()
 
     # create the plots
+    plot_failures = 0
     if not settings.EXTRACTIONS_ONLY:
-        for plot_class in plot_classes:
-            for region in regions:
-                for period in periods:
-                    for extraction_class in extraction_classes:
-                        if (
-                            (settings.EXTRACTIONS is None or extraction_class.specifier in settings.EXTRACTIONS)
-                            and extraction_class.has_region(region)
-                            and extraction_class.has_period(period)
-                        ):
-                            if (
-                                (settings.PLOTS is None or plot_class.specifier in settings.PLOTS)
-                                and plot_class.has_extraction(extraction_class)
-                                and extraction_class.has_region(region)
-                                and extraction_class.has_period(period)
-                            ):
-                                plot = plot_class(extraction_class, datasets, region, period,
-                                                  path=settings.PATHS[0].stem, dimensions=settings.PLACEHOLDERS,
-                                                  grid=settings.GRID, figs=settings.FIGS)
-                                plot.create()
+        plots = []
+        for plot in get_plots(datasets, regions, periods):
+            if settings.FORCE_PLOTS or not plot.is_current():
+                plots.append(plot)
+            else:
+                logger.info(f'skip {plot.region.specifier} {plot.extraction_class.specifier} {plot.specifier}')
+
+        if settings.PLOT_JOBS > 1:
+            # distribute the plots over a pool of processes
+            plot_failures = run_jobs(create_plot_job, [(plot.key, ) for plot in plots], jobs=settings.PLOT_JOBS)
+        else:
+            for plot in plots:
+                plot.create()
+
+        settings.READ_CACHE.log()
+
+    for store in settings.STORES.values():
+        store.close()
+
+    if failures:
+        logger.error(f'the extraction failed for {failures} of {len(datasets)} datasets')
+    if plot_failures:
+        logger.error(f'the plots failed for {plot_failures} of {len(plots)} plots')
+    if failures or plot_failures:
+        sys.exit(1)
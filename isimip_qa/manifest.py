@@ -0,0 +1,50 @@
+import json
+
+from .config import settings
+
+
+class Manifest:
+
+    def __init__(self, path, store):
+        self.path = path
+        self.store = store
+        self.files = {}  # entries for the input files, in the order of the rows in the extraction
+        self.state = {}  # state of the extraction, which is needed to continue it
+
+    def exists(self):
+        return self.store.exists(self.path)
+
+    def load(self):
+        data = json.loads(self.store.read(self.path))
+        self.files = data['files']
+        self.state = data.get('state', {})
+
+    def save(self):
+        self.store.write(self.path, json.dumps({'files': self.files, 'state': self.state}, indent=2).encode())
+
+    def add(self, file, **kwargs):
+        stat = file.path.stat()
+        entry = {
+            'path': str(file.path),
+            'size': stat.st_size,
+            'mtime': stat.st_mtime_ns
+        }
+        if settings.MANIFEST_CHECKSUMS:
+            entry['checksum'] = file.checksum
+
+        entry.update(kwargs)
+        self.files[file.path.name] = entry
+
+    def is_current(self, file, checksum=True):
+        entry = self.files.get(file.path.name)
+        if entry is None:
+            return False
+
+        stat = file.path.stat()
+        if entry['size'] != stat.st_size:
+            return False
+        elif entry['mtime'] == stat.st_mtime_ns:
+            return True
+        else:
+            # a file which was only touched is still current, if its checksum did not change
+            return checksum and 'checksum' in entry and entry['checksum'] == file.checksum
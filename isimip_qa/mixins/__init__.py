@@ -1,2 +1,23 @@
-from .extractions import CSVExtractionMixin, JSONExtractionMixin, RemoteExtractionMixin  # noqa: F401
-from .plots import FigurePlotMixin, GridPlotMixin  # noqa: F401
+import importlib
+
+# the mixins are imported when they are used, so that e.g. the extractions do not import matplotlib
+registry = {
+    'AggregateExtractionMixin': 'extractions',
+    'CSVExtractionMixin': 'extractions',
+    'JSONExtractionMixin': 'extractions',
+    'MapExtractionMixin': 'extractions',
+    'RemoteExtractionMixin': 'extractions',
+    'TableExtractionMixin': 'extractions',
+    'FigurePlotMixin': 'plots',
+    'GridPlotMixin': 'plots',
+}
+
+
+def __getattr__(name):
+    try:
+        module_name = registry[name]
+    except KeyError as e:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}') from e
+
+    module = importlib.import_module(f'.{module_name}', __name__)
+    return getattr(module, name)
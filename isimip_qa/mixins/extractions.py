@@ -1,34 +1,67 @@
+import io
 import json
 import logging
 
-import numpy as np
 import pandas as pd
 import xarray as xr
 
-from isimip_utils.fetch import fetch_file
-
+from ..accumulators import Aggregate
 from ..config import settings
 from ..exceptions import ExtractionNotFound
+from ..fetch import fetch_file, probe_file
+from ..formats import formats, get_index
+from ..utils import get_map, get_time_groups, parse_cftimes, parse_times
 
 logger = logging.getLogger(__name__)
 
 
 class RemoteExtractionMixin:
 
-    def fetch(self):
+    def get_remote_paths(self):
+        return [self.path.relative_to(settings.EXTRACTIONS_PATH)]
+
+    def download(self, cache=None):
+        # download the first available remote file, this does not write anything, so it can run in a thread
+        for path in self.get_remote_paths():
+            file_content = fetch_file(settings.EXTRACTIONS_LOCATIONS, path, cache=cache)
+            if file_content is not None:
+                return path, file_content
+
+        return None, None
+
+    def unpack(self, bundle):
+        # read the first available file from the bundle of the dataset
+        for path in self.get_remote_paths():
+            try:
+                return path, bundle.read(path.name)
+            except KeyError:
+                pass
+
+        return None, None
+
+    def probe(self, cache=None):
+        # check if a remote file is available, without downloading it
+        return any(probe_file(settings.EXTRACTIONS_LOCATIONS, path, cache=cache) for path in self.get_remote_paths())
+
+    def fetch(self, download=None):
         if settings.EXTRACTIONS_LOCATIONS:
-            path = self.path.relative_to(settings.EXTRACTIONS_PATH)
-            file_content = fetch_file(settings.EXTRACTIONS_LOCATIONS, path)
+            path, file_content = download or self.download()
             if file_content is not None:
                 logger.info('fetch %s', path)
-                self.path.parent.mkdir(exist_ok=True, parents=True)
-                self.path.open('wb').write(file_content)
+                self.save(path, file_content)
                 return self.path
             else:
-                logger.info('could not fetch %s', path)
+                logger.info('could not fetch %s', self.path.relative_to(settings.EXTRACTIONS_PATH))
 
+    def save(self, path, file_content):
+        self.store.write(self.path, file_content, key=self.key)
 
-class CSVExtractionMixin:
+
+class TableExtractionMixin:
+
+    @property
+    def format(self):
+        return formats[settings.EXTRACTIONS_FORMAT]
 
     @property
     def path(self):
@@ -37,9 +70,24 @@ class CSVExtractionMixin:
             replacements.update({'start_date': self.period.start_date, 'end_date': self.period.end_date})
 
         path = self.dataset.replace_name(**replacements)
-        return settings.EXTRACTIONS_PATH.joinpath(path).with_suffix('.csv')
+        return settings.EXTRACTIONS_PATH.joinpath(path).with_suffix(self.format.suffix)
+
+    def get_remote_paths(self):
+        paths = super().get_remote_paths()
+        if self.format.suffix != '.csv':
+            # the remote extractions might only be available as csv
+            paths.append(paths[0].with_suffix('.csv'))
+        return paths
+
+    def save(self, path, file_content):
+        if path.suffix == self.format.suffix:
+            super().save(path, file_content)
+        else:
+            # convert the csv to the format of the extractions
+            df = pd.read_csv(io.BytesIO(file_content))
+            self.format.write(self.store, self.path, df.set_index(get_index(df)), key=self.key)
 
-    def write(self, data, append=False):
+    def get_df(self, data):
         if isinstance(data, xr.core.dataset.Dataset):
             # this is a xarray dataset, so we convert it to a dataframe
             ds = data
@@ -50,43 +98,136 @@ class CSVExtractionMixin:
             else:
                 dim_order = tuple(ds.dims)
 
-            df = ds.to_dataframe(dim_order=dim_order)
+            return ds.to_dataframe(dim_order=dim_order)
         else:
             # this is a pandas dataframe
-            df = data
+            return data
+
+    def write(self, data, append=False, flush=False):
+        df = self.get_df(data)
+        if append and not self.format.appendable:
+            # the rows are collected and written at once in self.flush, so that the file is not written for every file,
+            # with flush=True (i.e. for the last file) the collected rows are written right away
+            try:
+                self.rows.append(df)
+            except AttributeError:
+                self.rows = [df]
 
-        if append:
-            df.to_csv(self.path, mode='a', header=False)
+            if flush:
+                self.flush()
         else:
-            self.path.parent.mkdir(exist_ok=True, parents=True)
-            df.to_csv(self.path)
+            self.rows = []
+            self.format.write(self.store, self.path, df, append=append, key=self.key)
+
+    def flush(self):
+        try:
+            rows = self.rows
+        except AttributeError:
+            return
+
+        if rows:
+            self.format.write(self.store, self.path, pd.concat(rows), append=True, key=self.key)
+            self.rows = []
+
+    def read_rows(self):
+        return self.format.read_rows(self.store, self.path)
+
+    def write_rows(self, header, blocks):
+        self.format.write_rows(self.store, self.path, header, blocks)
 
     def read(self):
-        # pandas cannot handle datetimes before 1677-09-22 so we need to
-        # manually set every timestamp before to None using a custom date_parser
-        def parse_time(time):
-            try:
-                return pd.Timestamp(np.datetime64(time))
-            except pd.errors.OutOfBoundsDatetime:
-                return pd.NaT
+        return settings.READ_CACHE.get(self.store, self.path, self.load)
 
-        # read the dataframe from the csv
+    def load(self):
+        # read the dataframe from the extraction file
         try:
-            df = pd.read_csv(self.path)
+            df = self.format.read(self.store, self.path)
         except FileNotFoundError as e:
             raise ExtractionNotFound from e
 
         if 'time' in df:
-            # parse the time axis of the dataframe
-            df['time'] = df['time'].apply(parse_time)
+            # parse the time axis of the dataframe, binary formats store it already as datetime
+            times = df.pop('time')
+            if pd.api.types.is_datetime64_any_dtype(times):
+                df.index = pd.DatetimeIndex(times, name='time').as_unit('s')
+            elif settings.CFTIME:
+                valid, index = parse_cftimes(times, settings.CFTIME)
+                df = df[valid]
+                df.index = index.rename('time')
+            else:
+                df.index = parse_times(times).rename('time')
 
             # remove all values without time
-            df = df[df.time.notnull()]
-            df.set_index('time', inplace=True)
+            df = df[df.index.notnull()]
 
         return df
 
 
+# the previous name of the TableExtractionMixin
+CSVExtractionMixin = TableExtractionMixin
+
+
+class AggregateExtractionMixin:
+
+    # the time series are also aggregated, so that the plots do not need to read the full series
+    resolutions = ['yearly', 'monthly', 'dayofyear']
+
+    def get_aggregate_path(self, resolution):
+        return self.path.with_name(f'{self.path.stem}_{resolution}{self.path.suffix}')
+
+    def get_aggregate_key(self, resolution):
+        return (f'{self.specifier}_{resolution}', self.region.specifier, self.period.specifier)
+
+    def aggregate(self, df):
+        try:
+            aggregates = self.aggregates
+        except AttributeError:
+            aggregates = self.aggregates = {resolution: Aggregate() for resolution in self.resolutions}
+
+        for resolution, aggregate in aggregates.items():
+            aggregate.add(df, get_time_groups(df.index, resolution))
+
+    def finish(self, files):
+        super().finish(files)
+
+        if self.resumed:
+            # the rows of the unchanged files were not aggregated in this run
+            self.aggregates = {resolution: Aggregate() for resolution in self.resolutions}
+            self.aggregate(self.read())
+
+        for resolution, aggregate in self.aggregates.items():
+            path = self.get_aggregate_path(resolution)
+            logger.info(f'write {path}')
+            self.format.write(self.store, path, aggregate.to_df(), key=self.get_aggregate_key(resolution))
+
+    def read_aggregate(self, resolution):
+        # return the mean, the standard deviation and the count, the aggregate is computed if it was not stored
+        path = self.get_aggregate_path(resolution)
+        try:
+            df = settings.READ_CACHE.get(self.store, path, lambda: self.format.read(self.store, path))
+        except FileNotFoundError:
+            aggregate = Aggregate()
+            df = self.read()
+            aggregate.add(df, get_time_groups(df.index, resolution))
+            df = aggregate.to_df()
+        else:
+            df = df.set_index(get_index(df))
+
+        columns = [column for column in df.columns if f'{column}_std' in df.columns]
+        return (
+            df[columns],
+            df[[f'{column}_std' for column in columns]].set_axis(columns, axis=1),
+            df[[f'{column}_count' for column in columns]].set_axis(columns, axis=1)
+        )
+
+
+class MapExtractionMixin:
+
+    def read_map(self):
+        # read the map as a dataset of 2d arrays, which is cached like the extraction itself
+        return settings.READ_CACHE.get(self.store, self.path, lambda: get_map(self.read()), name='map')
+
+
 class JSONExtractionMixin:
 
     @property
@@ -96,8 +237,13 @@ class JSONExtractionMixin:
         return settings.EXTRACTIONS_PATH.joinpath(path).with_suffix('.json')
 
     def write(self, data):
-        self.path.parent.mkdir(exist_ok=True, parents=True)
-        json.dump(data, self.path.open('w'))
+        self.store.write(self.path, json.dumps(data).encode(), key=self.key)
 
     def read(self):
-        return json.load(self.path.open())
+        return settings.READ_CACHE.get(self.store, self.path, self.load)
+
+    def load(self):
+        try:
+            return json.loads(self.store.read(self.path))
+        except FileNotFoundError as e:
+            raise ExtractionNotFound from e
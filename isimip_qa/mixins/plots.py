@@ -1,10 +1,14 @@
+import hashlib
+import json
 import logging
 import sys
+from collections import defaultdict
 from itertools import chain, product
 from pathlib import Path
 
 import matplotlib.pyplot as plt
 
+from .. import __version__
 from ..config import settings
 from ..exceptions import ExtractionNotFound
 from ..models import Subplot
@@ -14,6 +18,15 @@ logger = logging.getLogger(__name__)
 
 class FigurePlotMixin:
 
+    # the settings which change the figures
+    hash_settings = [
+        'YMIN', 'YMAX', 'VMIN', 'VMAX', 'CMAP', 'PRIMARY', 'GRID', 'FIGS',
+        'PLOTS_FORMAT', 'ROW_RANGES', 'COLUMN_RANGES', 'CFTIME', 'MAP_DECIMATION'
+    ]
+
+    # the aggregates of the extractions which are read for the plot
+    aggregates = []
+
     def write(self, fig, path):
         path.parent.mkdir(exist_ok=True, parents=True)
 
@@ -25,8 +38,70 @@ class FigurePlotMixin:
             fig.savefig(path)
         except ValueError as e:
             logger.error(f'could not save {path} ({e})')
+        else:
+            self.get_hash_path(path).write_text(self.get_hash())
         plt.close()
 
+    def get_hash(self):
+        # hash the plot, the settings and the content of the extractions which are read for the plot
+        try:
+            return self.hash
+        except AttributeError:
+            pass
+
+        inputs = {
+            'version': __version__,
+            'plot': [type(self).__name__, *self.key],
+            'dimensions': self.dimensions,
+            'grid': self.grid,
+            'figs': self.figs,
+            'settings': {key: getattr(settings, key) for key in self.hash_settings}
+        }
+        plot_hash = hashlib.sha256(json.dumps(inputs, sort_keys=True, default=str).encode())
+
+        for dataset in self.datasets:
+            extraction = self.extraction_class(dataset, self.region, self.period)
+            paths = [extraction.path, *(extraction.get_aggregate_path(resolution) for resolution in self.aggregates)]
+            for path in paths:
+                try:
+                    plot_hash.update(self.get_digest(extraction.store, path))
+                except FileNotFoundError:
+                    plot_hash.update(b'missing')
+
+            try:
+                attrs = self.get_attrs(dataset)
+            except ExtractionNotFound:
+                attrs = None
+            plot_hash.update(json.dumps(attrs, sort_keys=True).encode())
+
+        self.hash = plot_hash.hexdigest()
+        return self.hash
+
+    def get_digest(self, store, path):
+        # the extractions are shared between the plots, so their digests are only computed once per version
+        key = (str(path), store.get_version(path))
+        try:
+            return settings.DIGESTS[key]
+        except KeyError:
+            digest = settings.DIGESTS[key] = hashlib.sha256(store.read(path)).digest()
+            return digest
+
+    def get_hash_path(self, path):
+        return path.with_suffix(path.suffix + '.hash')
+
+    def is_current(self):
+        # the plot is current if all figures were created from the same inputs
+        nfigs, _, _ = self.get_grid()
+        for ifig in range(nfigs):
+            path = self.get_figure_path(ifig)
+            try:
+                if not path.exists() or self.get_hash_path(path).read_text() != self.get_hash():
+                    return False
+            except FileNotFoundError:
+                return False
+
+        return True
+
     def show(self):
         plt.show()
         plt.close()
@@ -190,6 +265,7 @@ class GridPlotMixin:
                 marker = '.'
 
             subplot = Subplot(
+                dataset=dataset,
                 df=df,
                 attrs=attrs,
                 var=var,
@@ -258,35 +334,60 @@ class GridPlotMixin:
 
     def get_ymin(self, subplot, subplots):
         if settings.YMIN is None:
-            return min([sp.df[sp.df > 0].loc[:, sp.var].min() for sp in subplots
-                        if self.is_in_same_plot(sp, subplot)]) * 0.99
+            return self.get_range(subplot, subplots)[0] * 0.99
         else:
             return settings.YMIN
 
     def get_ymax(self, subplot, subplots):
         if settings.YMAX is None:
-            return max([sp.df[sp.var].max() for sp in subplots
-                        if self.is_in_same_plot(sp, subplot)]) * 1.01
+            return self.get_range(subplot, subplots)[1] * 1.01
         else:
             return settings.YMAX
 
     def get_vmin(self, subplot, subplots):
         if settings.VMIN is None:
-            return min([sp.df[sp.df > 0].loc[:, sp.var].min() for sp in subplots
-                        if self.is_in_same_plot(sp, subplot)])
+            return self.get_range(subplot, subplots)[0]
         else:
             return settings.VMIN
 
     def get_vmax(self, subplot, subplots):
         if settings.VMAX is None:
-            return max([sp.df[sp.var].max() for sp in subplots
-                        if self.is_in_same_plot(sp, subplot)])
+            return self.get_range(subplot, subplots)[1]
         else:
             return settings.VMAX
 
-    def is_in_same_plot(self, sp, subplot):
+    def get_range(self, subplot, subplots):
+        # the ranges of all groups are computed once for the list of subplots
+        try:
+            ranges_subplots, ranges = self.ranges
+        except AttributeError:
+            ranges_subplots, ranges = None, None
+
+        if ranges_subplots is not subplots:
+            groups = defaultdict(list)
+            for sp in subplots:
+                groups[self.get_range_key(sp)].append(self.get_subplot_range(sp))
+
+            ranges = {
+                key: (min(sp_range[0] for sp_range in sp_ranges), max(sp_range[1] for sp_range in sp_ranges))
+                for key, sp_ranges in groups.items()
+            }
+            self.ranges = (subplots, ranges)
+
+        return ranges[self.get_range_key(subplot)]
+
+    def get_range_key(self, subplot):
+        # subplots with the same key share their range
         return (
-            not settings.ROW_RANGES or (sp.irow == subplot.irow)
-        ) and (
-            not settings.COLUMN_RANGES or (sp.icol == subplot.icol)
+            subplot.irow if settings.ROW_RANGES else None,
+            subplot.icol if settings.COLUMN_RANGES else None
         )
+
+    def get_subplot_range(self, subplot):
+        # the minimum of the positive values and the maximum, which are stored with the subplot
+        try:
+            return subplot.range
+        except AttributeError:
+            values = subplot.df[subplot.var]
+            subplot.range = (values[values > 0].min(), values.max())
+            return subplot.range
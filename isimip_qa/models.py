@@ -1,10 +1,22 @@
+import hashlib
+import json
 import logging
+import os
+import shutil
+from collections import OrderedDict
 from pathlib import Path
 
 import cftime
+import numpy as np
 import xarray as xr
 
+from isimip_utils.checksum import get_checksum
+from isimip_utils.decorators import cached_property
+
 from .config import settings
+from .manifest import Manifest
+from .stores import get_store
+from .utils import get_grid_key, iter_time_chunks
 
 logger = logging.getLogger(__name__)
 
@@ -44,15 +56,19 @@ class File:
         self.index = index
         self.first = first
         self.last = last
+        self.cache = None
 
     def open(self):
         logger.info(f'open {self.path}')
 
+        # the cache shares computations on the open file between the extractions
+        self.cache = FileCache()
+
         try:
-            self.ds = xr.open_dataset(self.path)
+            self.ds = xr.open_dataset(self.path, chunks=settings.CHUNKS)
         except ValueError:
             # workaround for non standard times (e.g. growing seasons)
-            self.ds = xr.open_dataset(self.path, decode_times=False)
+            self.ds = xr.open_dataset(self.path, chunks=settings.CHUNKS, decode_times=False)
 
             if self.ds['time'].units.startswith('growing seasons'):
                 units = self.ds['time'].units.replace('growing seasons', 'common_years')
@@ -68,6 +84,41 @@ class File:
         logger.info(f'close {self.path}')
         self.ds.close()
         del self.ds
+        self.cache = None
+
+    @cached_property
+    def checksum(self):
+        # the checksum is computed only once for all extractions of the file
+        return get_checksum(self.path)
+
+
+class FileCache:
+
+    # the extractions run region by region, so only a few entries need to be kept,
+    # while the masked views of previous regions can be evicted
+    maxsize = 4
+
+    def __init__(self):
+        self.data = OrderedDict()
+
+        # the results of the stacks are used by all regions of the stack, so they are kept until the file is closed
+        self.stacks = {}
+
+    def get(self, key, compute):
+        try:
+            self.data.move_to_end(key)
+        except KeyError:
+            self.data[key] = compute()
+            if len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+
+        return self.data[key]
+
+    def get_stack(self, key, compute):
+        if key not in self.stacks:
+            self.stacks[key] = compute()
+
+        return self.stacks[key]
 
 
 class Region:
@@ -75,15 +126,138 @@ class Region:
     def __init__(self, **kwargs):
         self.type = kwargs['type']
         self.specifier = kwargs['specifier']
+        self.stack = None
 
         if self.type == 'point':
             self.lat = kwargs['lat']
             self.lon = kwargs['lon']
 
         elif self.type == 'mask':
-            if kwargs['mask_path'] not in settings.MASKS:
-                settings.MASKS[kwargs['mask_path']] = Mask(kwargs['mask_path'])
-            self.mask = settings.MASKS[kwargs['mask_path']][kwargs['mask_variable']]
+            self.mask_path = kwargs['mask_path']
+            self.mask_variable = kwargs['mask_variable']
+            if self.mask_path not in settings.MASKS:
+                settings.MASKS[self.mask_path] = Mask(self.mask_path)
+
+            # the mask is compiled into the index slices of the bounding box of its cells
+            # and a boolean footprint within this box, so that only these cells are read
+            mask = settings.MASKS[self.mask_path]
+            self.mask_lat, self.mask_lon = mask.lat, mask.lon
+            self.bbox, self.footprint = mask[self.mask_variable]
+
+    @cached_property
+    def mask(self):
+        # expand the footprint to the full grid of the mask
+        return self.footprint.astype(np.int8).reindex(lat=self.mask_lat, lon=self.mask_lon, fill_value=0)
+
+    def has_grid(self, ds):
+        return (
+            self.type == 'mask'
+            and np.array_equal(ds.lat.values, self.mask_lat)
+            and np.array_equal(ds.lon.values, self.mask_lon)
+        )
+
+
+class RegionStack:
+
+    def __init__(self, regions):
+        self.regions = regions
+        self.specifiers = [region.specifier for region in regions]
+
+        # stack the masks into a matrix of shape (cells, regions), but only use the
+        # cells which are part of at least one of the regions
+        masks = np.stack([(region.mask == 1).values.ravel() for region in regions])
+        self.cells = np.flatnonzero(masks.any(axis=0))
+        self.matrix = masks[:, self.cells].T.astype(np.float64)
+        self.weighted_matrices = {}
+
+        for region in regions:
+            region.stack = self
+
+    def has_grid(self, ds):
+        return self.regions[0].has_grid(ds)
+
+    def get_cells(self, da):
+        # gather the values of the cells in the stack as an array of shape (time, cells)
+        values = np.asarray(da.transpose('time', 'lat', 'lon').values)
+        return values.reshape(values.shape[0], -1)[:, self.cells]
+
+    def reduce(self, ds, function):
+        data_vars = {}
+        for var_name, var in ds.data_vars.items():
+            if {'time', 'lat', 'lon'}.issubset(var.dims):
+                results = []
+                for chunk in iter_time_chunks(var):
+                    values = self.get_cells(chunk)
+                    valid = ~np.isnan(values)
+                    results.append(function(np.where(valid, values, 0), valid))
+
+                data_vars[var_name] = (('time', 'region'), np.concatenate(results))
+
+        return xr.Dataset(data_vars, coords={'time': ds.time, 'region': self.specifiers})
+
+    def count(self, file, period, ds):
+        def compute():
+            return self.reduce(ds, lambda values, valid: np.rint(valid @ self.matrix).astype(np.int64))
+
+        return file.cache.get_stack(('stack', id(self), 'count', period.key), compute)
+
+    def get_weighted_matrix(self, ds, weights):
+        # the matrix multiplied with the area weights is computed only once for every grid
+        key = (get_grid_key(ds), id(weights))
+        if key not in self.weighted_matrices:
+            cell_weights = self.get_cells(weights.broadcast_like(ds.lon).expand_dims(time=1))[0]
+            self.weighted_matrices[key] = self.matrix * cell_weights[:, np.newaxis]
+
+        return self.weighted_matrices[key]
+
+    def mean(self, file, period, ds, weights):
+        def compute():
+            weighted_matrix = self.get_weighted_matrix(ds, weights)
+
+            def function(values, valid):
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    return (values @ weighted_matrix) / (valid @ weighted_matrix)
+
+            return self.reduce(ds, function)
+
+        return file.cache.get_stack(('stack', id(self), 'mean', period.key), compute)
+
+
+class PointStack:
+
+    def __init__(self, regions):
+        self.regions = regions
+
+        # a region which is given more than once is only selected once, so that the specifiers are unique
+        points = list({region.specifier: region for region in regions}.values())
+        self.specifiers = [region.specifier for region in points]
+        self.lat = np.array([region.lat for region in points], dtype=np.float64)
+        self.lon = np.array([region.lon for region in points], dtype=np.float64)
+
+        self.grid = None
+        self.indexes = None
+
+        for region in regions:
+            region.stack = self
+
+    def get_indexes(self, ds):
+        # resolve the points to the nearest indexes of the grid, but only once for every grid
+        grid = (ds.lat.values, ds.lon.values)
+        if self.grid is None or not all(np.array_equal(a, b) for a, b in zip(grid, self.grid)):
+            self.grid = grid
+            self.indexes = {
+                'lat': xr.DataArray(ds.indexes['lat'].get_indexer(self.lat, method='nearest'), dims='point'),
+                'lon': xr.DataArray(ds.indexes['lon'].get_indexer(self.lon, method='nearest'), dims='point')
+            }
+
+        return self.indexes
+
+    def select(self, file, period, ds):
+        def compute():
+            # select all points with one vectorized isel and keep the (small) result in memory
+            return ds.isel(self.get_indexes(ds)).assign_coords(point=self.specifiers).compute()
+
+        return file.cache.get_stack(('stack', id(self), 'select', period.key), compute)
 
 
 class Mask:
@@ -93,10 +267,97 @@ class Mask:
         if not path.is_absolute():
             path = settings.DATASETS_PATH / path
 
-        self.ds = xr.load_dataset(path)
+        self.path = path
+        self.ds = None
+        self.masks = {}
 
-    def __getitem__(self, item):
-        return self.ds[item]
+        # the compiled masks are stored in the cache, keyed by the path and the mtime of the mask file
+        if settings.CACHE_PATH:
+            self.cache_key = hashlib.sha1(str(path.resolve()).encode()).hexdigest()
+            self.cache_path = settings.CACHE_PATH / 'masks' / f'{self.cache_key}-{path.stat().st_mtime_ns}'
+        else:
+            self.cache_path = None
+
+        try:
+            self.lat = self.load_array('lat')
+            self.lon = self.load_array('lon')
+        except FileNotFoundError:
+            self.open()
+            self.lat = self.ds.lat.values
+            self.lon = self.ds.lon.values
+            self.save_array('lat', self.lat)
+            self.save_array('lon', self.lon)
+
+    def __getitem__(self, variable):
+        if variable not in self.masks:
+            try:
+                bbox = self.load_array(f'{variable}.bbox')
+                footprint = self.load_array(f'{variable}.footprint')
+            except FileNotFoundError:
+                bbox, footprint = self.compile(variable)
+                self.save_array(f'{variable}.bbox', bbox)
+                self.save_array(f'{variable}.footprint', footprint)
+
+            bbox = {
+                'lat': slice(int(bbox[0]), int(bbox[1])),
+                'lon': slice(int(bbox[2]), int(bbox[3]))
+            }
+            footprint = xr.DataArray(footprint, dims=('lat', 'lon'), coords={
+                'lat': self.lat[bbox['lat']],
+                'lon': self.lon[bbox['lon']]
+            })
+            self.masks[variable] = bbox, footprint
+
+        return self.masks[variable]
+
+    def open(self):
+        if self.ds is None:
+            logger.info(f'open {self.path}')
+            self.ds = xr.open_dataset(self.path)
+
+    def close(self):
+        if self.ds is not None:
+            self.ds.close()
+            self.ds = None
+
+    def compile(self, variable):
+        self.open()
+
+        values = (self.ds[variable] == 1).values
+        lat_index, lon_index = np.nonzero(values)
+        if lat_index.size:
+            bbox = np.array([lat_index.min(), lat_index.max() + 1, lon_index.min(), lon_index.max() + 1])
+        else:
+            bbox = np.zeros(4, dtype=np.int64)
+
+        return bbox, values[bbox[0]:bbox[1], bbox[2]:bbox[3]]
+
+    def load_array(self, name):
+        if self.cache_path is None:
+            raise FileNotFoundError
+
+        return np.load(self.cache_path / f'{name}.npy', mmap_mode='r')
+
+    def save_array(self, name, array):
+        # the plan only reads the cache
+        if self.cache_path is not None and not settings.PLAN:
+            if not self.cache_path.exists():
+                self.prune()
+                self.cache_path.mkdir(exist_ok=True, parents=True)
+
+            # write to a temporary file first, since other processes might read the cache at the same time
+            file_path = self.cache_path / f'{name}.npy'
+            tmp_path = file_path.with_name(f'{file_path.name}.{os.getpid()}')
+            with tmp_path.open('wb') as fp:
+                np.save(fp, array)
+            tmp_path.replace(file_path)
+
+    def prune(self):
+        # remove the compiled masks of previous versions of the mask file
+        for path in self.cache_path.parent.glob(f'{self.cache_key}-*'):
+            if path != self.cache_path:
+                logger.info(f'remove {path}')
+                shutil.rmtree(path, ignore_errors=True)
 
 
 class Period:
@@ -108,26 +369,233 @@ class Period:
             self.start_date = str(kwargs['start_date'])
             self.end_date = str(kwargs['end_date'])
 
+    @property
+    def key(self):
+        if self.type == 'slice':
+            return (self.type, self.start_date, self.end_date)
+        else:
+            return (self.type, )
+
+    @property
+    def specifier(self):
+        if self.type == 'slice':
+            return f'{self.start_date}_{self.end_date}'
+        else:
+            return self.type
+
 
 class Extraction:
 
     region_types = None
     period_types = None
 
+    # the rows of a 'series' can be patched for changed files, other extractions
+    # can only be continued ('append') when new files were added after the existing files
+    resume_type = 'append'
+
     def __init__(self, dataset, region=None, period=None, gridarea=None):
         self.dataset = dataset
         self.region = region or Region(type='global', specifier='global')
         self.period = period or Period(type='auto')
         self.gridarea = gridarea
+        self.files = None
+        self.resumed = False
 
     @property
     def path(self):
         raise NotImplementedError
 
+    @property
+    def store(self):
+        return get_store(self.dataset)
+
+    @property
+    def key(self):
+        # the key of the extraction in a store
+        return (self.specifier, self.region.specifier, self.period.specifier)
+
+    @property
+    def manifest_path(self):
+        return self.path.with_suffix('.manifest.json')
+
+    @property
+    def checkpoint_path(self):
+        return self.path.with_suffix('.checkpoint.npz')
+
     def exists(self):
-        return self.path.exists()
+        return self.store.exists(self.path)
+
+    def is_first(self, file):
+        # a resumed extraction continues the existing output
+        return file.first and not self.resumed
+
+    def resume(self, files):
+        # compare the files with the manifest of the existing extraction and
+        # return the files which need to be extracted, an empty list means that the extraction is complete
+        manifest = Manifest(self.manifest_path, self.store)
+        if not manifest.exists():
+            # extractions without manifest (e.g. fetched ones) are considered complete
+            return []
+
+        manifest.load()
+
+        pending = [file for file in files if not manifest.is_current(file)]
+        current = [file for file in files if file not in pending]
+        removed = set(manifest.files) - {file.path.name for file in files}
+        if not pending and not removed:
+            return []
+
+        self.manifest = manifest
+        if self.resume_type == 'series':
+            if self.patch(current):
+                logger.info(f'patch {self.path} with {len(pending)} files')
+                self.resumed = True
+                return pending
+
+        elif self.resume_type == 'append':
+            if not removed and files[:len(current)] == current and not any(
+                file.path.name in manifest.files for file in pending
+            ):
+                logger.info(f'continue {self.path} with {len(pending)} files')
+                self.restore()
+                self.resumed = True
+                return pending
+
+        # the extraction cannot be continued and is created again from all files
+        del self.manifest
+        return files
+
+    def get_pending(self, files):
+        # estimate the files which need to be extracted, without reading the data, touched files count as changed
+        if settings.FORCE or not self.exists():
+            return files
+
+        manifest = Manifest(self.manifest_path, self.store)
+        if not manifest.exists():
+            return []
+
+        manifest.load()
+        return [file for file in files if not manifest.is_current(file, checksum=False)]
+
+    def patch(self, files):
+        # remove the rows of changed and removed files from the time series,
+        # the rows of the pending files are appended and sorted in self.finish
+        header, rows = self.read_rows()
+        blocks = self.get_blocks(rows)
+        if blocks is None:
+            return False
+
+        self.write_rows(header, [blocks[file.path.name] for file in files])
+        self.manifest.files = {file.path.name: self.manifest.files[file.path.name] for file in files}
+        return True
+
+    def get_blocks(self, rows):
+        # split the rows of the time series into the blocks for the files in the manifest
+        blocks, start = {}, 0
+        for name, entry in self.manifest.files.items():
+            blocks[name] = rows[start:start + entry['rows']]
+            start += entry['rows']
+
+        return blocks if start == len(rows) else None
+
+    def record(self, file):
+        # record the file in the manifest, the number of rows is used to patch the time series later
+        try:
+            manifest = self.manifest
+        except AttributeError:
+            manifest = self.manifest = Manifest(self.manifest_path, self.store)
 
-    def fetch(self):
+        manifest.add(file, rows=int(self.select_period(file).time.size))
+
+    def checkpoint(self):
+        self.flush()
+
+        arrays = self.get_checkpoint()
+        if arrays is not None:
+            # store the state of the extraction together with the files processed so far
+            arrays['manifest'] = np.array(json.dumps({'files': self.manifest.files, 'state': self.get_state()}))
+
+            logger.info(f'write {self.checkpoint_path}')
+            self.checkpoint_path.parent.mkdir(exist_ok=True, parents=True)
+            tmp_path = self.checkpoint_path.with_name(self.checkpoint_path.name + '.tmp')
+            with tmp_path.open('wb') as fp:
+                np.savez(fp, **arrays)
+            tmp_path.replace(self.checkpoint_path)
+
+        elif self.resume_type == 'series':
+            # time series are written file by file, so that the manifest is enough to continue them
+            self.manifest.save()
+
+    def resume_checkpoint(self, files):
+        # load the state of an interrupted extraction from its checkpoint and return the remaining files
+        try:
+            with np.load(self.checkpoint_path) as checkpoint:
+                arrays = dict(checkpoint)
+        except FileNotFoundError:
+            return files
+
+        manifest = Manifest(self.manifest_path, self.store)
+        data = json.loads(arrays.pop('manifest').item())
+        manifest.files, manifest.state = data['files'], data['state']
+
+        current = files[:len(manifest.files)]
+        if (
+            [file.path.name for file in current] != list(manifest.files)
+            or not all(manifest.is_current(file) for file in current)
+            or len(current) == len(files)
+        ):
+            logger.info(f'ignore {self.checkpoint_path}, since the files have changed')
+            return files
+
+        logger.info(f'resume {self.path} from {self.checkpoint_path}')
+        self.manifest = manifest
+        self.set_checkpoint(arrays)
+        self.resumed = True
+        return files[len(current):]
+
+    def finish(self, files):
+        self.flush()
+
+        if self.resumed and self.resume_type == 'series':
+            # bring the appended rows into the order of the files
+            header, rows = self.read_rows()
+            blocks = self.get_blocks(rows)
+            self.write_rows(header, [blocks[file.path.name] for file in files])
+
+        self.manifest.files = {file.path.name: self.manifest.files[file.path.name] for file in files}
+        self.manifest.state = self.get_state()
+        self.manifest.save()
+
+        self.checkpoint_path.unlink(missing_ok=True)
+
+    def flush(self):
+        # write the rows which were collected by self.write
+        pass
+
+    def restore(self):
+        # restore the state of the extraction from the existing output and self.manifest.state
+        pass
+
+    def get_state(self):
+        return {}
+
+    def get_checkpoint(self):
+        # extractions which accumulate their result in memory return their state as numpy arrays
+        return None
+
+    def set_checkpoint(self, arrays):
+        pass
+
+    def download(self, cache=None):
+        raise NotImplementedError
+
+    def unpack(self, bundle):
+        raise NotImplementedError
+
+    def probe(self, cache=None):
+        raise NotImplementedError
+
+    def fetch(self, download=None):
         raise NotImplementedError
 
     def extract(self, file):
@@ -136,6 +604,40 @@ class Extraction:
     def read(self):
         raise NotImplementedError
 
+    def read_rows(self):
+        raise NotImplementedError
+
+    def write_rows(self, header, blocks):
+        raise NotImplementedError
+
+    def select_period(self, file):
+        def compute():
+            if self.period.type == 'slice':
+                return file.ds.sel(time=slice(self.period.start_date, self.period.end_date))
+            else:
+                return file.ds
+
+        return file.cache.get(('period', self.period.key), compute)
+
+    def select_region(self, file):
+        def compute():
+            ds = self.select_period(file)
+            if self.region.type == 'mask':
+                if self.region.has_grid(ds):
+                    return ds.isel(self.region.bbox).where(self.region.footprint)
+                else:
+                    return ds.where(self.region.mask == 1)
+            elif self.region.type == 'point':
+                if self.region.stack is not None:
+                    points_ds = self.region.stack.select(file, self.period, ds)
+                    return points_ds.sel(point=self.region.specifier).drop_vars('point')
+                else:
+                    return ds.sel(lat=self.region.lat, lon=self.region.lon, method='nearest')
+            else:
+                return ds
+
+        return file.cache.get(('region', self.region.specifier, self.period.key), compute)
+
     @classmethod
     def has_region(cls, region):
         return cls.region_types is None or region.type in cls.region_types
@@ -157,6 +659,11 @@ class Plot:
         self.region = region or Region(type='global', specifier='global')
         self.period = period or Period(type='auto')
 
+    @property
+    def key(self):
+        # identifies the plot across processes
+        return (self.specifier, self.extraction_class.specifier, self.region.specifier, self.period.key)
+
     def create(self):
         raise NotImplementedError
 
@@ -0,0 +1,123 @@
+import json
+from pathlib import Path
+
+from .config import settings
+from .fetch import probe_extractions
+
+
+def get_extraction_tasks(extractions):
+    tasks = []
+
+    # only the missing extractions can be fetched
+    missing = [extraction for extraction in extractions if not settings.FORCE and not extraction.exists()]
+    fetchable = dict(zip(missing, probe_extractions(missing)))
+
+    for extraction in extractions:
+        if fetchable.get(extraction):
+            files = []
+            status = 'fetchable'
+        else:
+            files = extraction.get_pending(extraction.dataset.files)
+            status = 'compute' if files else 'cached'
+
+        tasks.append({
+            'type': 'extraction',
+            'dataset': str(extraction.dataset.path),
+            'extraction': extraction.specifier,
+            'region': extraction.region.specifier,
+            'period': extraction.period.specifier,
+            'path': str(extraction.path),
+            'status': status,
+            'files': [str(file.path) for file in files],
+            'bytes': sum(file.path.stat().st_size for file in files)
+        })
+
+    return tasks
+
+
+def get_plot_tasks(plots, extraction_tasks):
+    # plots of extractions which are fetched or computed will change
+    changed = {
+        (task['dataset'], task['extraction'], task['region'], task['period'])
+        for task in extraction_tasks if task['status'] != 'cached'
+    }
+
+    tasks = []
+    for plot in plots:
+        if settings.FORCE_PLOTS or any(
+            (
+                str(dataset.path), plot.extraction_class.specifier, plot.region.specifier, plot.period.specifier
+            ) in changed
+            for dataset in plot.datasets
+        ) or not plot.is_current():
+            status = 'compute'
+        else:
+            status = 'cached'
+
+        nfigs, _, _ = plot.get_grid()
+        for ifig in range(nfigs):
+            tasks.append({
+                'type': 'plot',
+                'plot': plot.specifier,
+                'extraction': plot.extraction_class.specifier,
+                'region': plot.region.specifier,
+                'period': plot.period.specifier,
+                'path': str(plot.get_figure_path(ifig)),
+                'status': status
+            })
+
+    return tasks
+
+
+def get_plan(extractions, plots):
+    extraction_tasks = get_extraction_tasks(extractions)
+    tasks = extraction_tasks + get_plot_tasks(plots, extraction_tasks)
+
+    # the files are opened once for all extractions of a dataset
+    files = {}
+    for task in tasks:
+        if task['type'] == 'extraction':
+            for file_path in task['files']:
+                files[file_path] = Path(file_path).stat().st_size
+
+    summary = {
+        'extractions': {
+            status: len([task for task in tasks if task['type'] == 'extraction' and task['status'] == status])
+            for status in ['cached', 'fetchable', 'compute']
+        },
+        'plots': {
+            status: len([task for task in tasks if task['type'] == 'plot' and task['status'] == status])
+            for status in ['cached', 'compute']
+        },
+        'files': len(files),
+        'bytes': sum(files.values())
+    }
+
+    return {'summary': summary, 'tasks': tasks}
+
+
+def format_bytes(size):
+    for unit in ['B', 'KB', 'MB', 'GB', 'TB']:
+        if size < 1024 or unit == 'TB':
+            return f'{size:.0f} {unit}' if unit == 'B' else f'{size:.1f} {unit}'
+        size /= 1024
+
+
+def print_plan(plan):
+    if settings.PLAN == 'json':
+        print(json.dumps(plan, indent=2))
+    else:
+        for task in plan['tasks']:
+            if task['type'] == 'extraction':
+                print(f"{task['status']:<10} {task['path']}", end='')
+                print(f" ({len(task['files'])} files, {format_bytes(task['bytes'])})" if task['files'] else '')
+            else:
+                print(f"{task['status']:<10} {task['path']}")
+
+        summary = plan['summary']
+        print()
+        print('extractions: {cached} cached, {fetchable} fetchable, {compute} to compute'.format(
+            **summary['extractions']
+        ))
+        print(f"files: {summary['files']} to read ({format_bytes(summary['bytes'])})")
+        print('plots: {cached} cached, {compute} to create'.format(**summary['plots']))
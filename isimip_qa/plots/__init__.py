@@ -1,22 +1,37 @@
 import importlib
-import inspect
-import os
-from pathlib import Path
-
-from ..models import Plot
-
-path = Path(__file__).parent
-
-# gather plot classes from the python files in this directory
-plot_classes = set()
-for root, dirs, files in os.walk(path):
-    for file_name in sorted(files):
-        file_path = path / root / file_name
-        if file_path.suffix == '.py' and file_path.name != '__init__.py':
-            parts = file_path.relative_to(path.parent.parent).with_suffix('').parts
-            module_name = '.'.join(parts)
-            module = importlib.import_module(module_name)
-            for module_class_name, module_class in inspect.getmembers(module, inspect.isclass):
-                if module_class != Plot and issubclass(module_class, Plot):
-                    plot_classes.add(module_class)
-                    globals()[module_class_name] = module_class
+
+# the module and the name of the plot classes, the modules are only imported when the class is used
+registry = {
+    'cdf': ('cdf', 'CDFPlot'),
+    'daily': ('daily', 'DailyPlot'),
+    'dayofyear': ('dayofyear', 'DayOfYearPlot'),
+    'map': ('map', 'MapPlot'),
+    'monthofyear': ('monthofyear', 'MonthOfYearPlot'),
+    'pdf': ('pdf', 'PDFPlot'),
+    'yearly': ('yearly', 'YearlyPlot'),
+}
+
+
+def get_plot_class(specifier):
+    module_name, class_name = registry[specifier]
+    module = importlib.import_module(f'.{module_name}', __name__)
+    return getattr(module, class_name)
+
+
+def get_plot_classes(specifiers=None):
+    return [
+        get_plot_class(specifier)
+        for specifier in registry
+        if specifiers is None or specifier in specifiers
+    ]
+
+
+def __getattr__(name):
+    if name == 'plot_classes':
+        return get_plot_classes()
+
+    for specifier, (module_name, class_name) in registry.items():
+        if class_name == name:
+            return get_plot_class(specifier)
+
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
@@ -11,10 +11,11 @@ class DayOfYearPlot(FigurePlotMixin, GridPlotMixin, Plot):
 
     specifier = 'dayofyear'
     extractions = ['mean']
+    aggregates = ['dayofyear']
 
     def get_df(self, dataset):
         extraction = self.extraction_class(dataset, self.region, self.period)
-        df = extraction.read().groupby(lambda x: x.dayofyear).mean()
+        df, _, _ = extraction.read_aggregate('dayofyear')
         mean, std =  df.mean().values, df.std().values
         return (df - mean) / (std if std > 0 else 1.0)
 
@@ -1,7 +1,7 @@
 import logging
 
 import matplotlib.pyplot as plt
-import pandas as pd
+import numpy as np
 
 from ..config import settings
 from ..extractions import AttrsExtraction
@@ -24,6 +24,54 @@ class MapPlot(FigurePlotMixin, GridPlotMixin, Plot):
     def get_attrs(self, dataset):
         return AttrsExtraction(dataset, self.region, self.period).read()
 
+    def get_map(self, subplot):
+        # the map is stored with the subplot, like the bbox
+        try:
+            return subplot.map
+        except AttributeError:
+            extraction = self.extraction_class(subplot.dataset, self.region, self.period)
+            subplot.map = extraction.read_map()[subplot.var]
+            return subplot.map
+
+    def get_bbox(self, subplot):
+        # the extension of the valid data including the half cells at the edges
+        try:
+            return subplot.bbox
+        except AttributeError:
+            da = self.get_map(subplot)
+            valid = da.notnull().values
+
+            if valid.any():
+                lat, lon = da.lat.values, da.lon.values
+                lat_valid, lon_valid = lat[valid.any(axis=1)], lon[valid.any(axis=0)]
+                lat_delta = 0.5 * abs(lat[1] - lat[0]) if lat.size > 1 else 0
+                lon_delta = 0.5 * abs(lon[1] - lon[0]) if lon.size > 1 else 0
+                subplot.bbox = (
+                    lon_valid.min() - lon_delta, lon_valid.max() + lon_delta,
+                    lat_valid.min() - lat_delta, lat_valid.max() + lat_delta
+                )
+            else:
+                subplot.bbox = None
+
+            return subplot.bbox
+
+    def decimate(self, values, ax):
+        # reduce the map to the resolution of the axes using block means
+        bbox = ax.get_window_extent()
+        lat_factor = max(1, values.shape[0] // max(1, int(bbox.height)))
+        lon_factor = max(1, values.shape[1] // max(1, int(bbox.width)))
+        if lat_factor == 1 and lon_factor == 1:
+            return values
+
+        valid = np.isfinite(values)
+        sums, counts = np.where(valid, values, 0), valid.astype(np.int64)
+        for axis, factor in [(0, lat_factor), (1, lon_factor)]:
+            indices = np.arange(0, values.shape[axis], factor)
+            sums = np.add.reduceat(sums, indices, axis=axis)
+            counts = np.add.reduceat(counts, indices, axis=axis)
+
+        return np.where(counts > 0, sums / np.maximum(counts, 1), np.nan)
+
     def create(self):
         logger.info(f'plot {self.region.specifier} {self.extraction_class.specifier} {self.specifier}')
 
@@ -34,21 +82,11 @@ class MapPlot(FigurePlotMixin, GridPlotMixin, Plot):
             lonmin, lonmax, latmin, latmax, ratio = -180, 180, -90, 90, 2.0
             if self.region.specifier != 'global':
                 for sp in subplots:
-                    sp_lon = sp.df['lon'].unique()
-                    sp_londelta = 0.5 * abs(sp_lon[1] - sp_lon[0])
-                    sp_lonmin = sp.df.where(pd.notna(sp.df[sp.df.columns[-1]]))['lon'].min()
-                    sp_lonmax = sp.df.where(pd.notna(sp.df[sp.df.columns[-1]]))['lon'].max()
-
-                    lonmin = max(lonmin, sp_lonmin - sp_londelta)
-                    lonmax = min(lonmax, sp_lonmax + sp_londelta)
-
-                    sp_lat = sp.df['lat'].unique()
-                    sp_latdelta = 0.5 * abs(sp_lat[1] - sp_lat[0])
-                    sp_latmin = sp.df.where(pd.notna(sp.df[sp.df.columns[-1]]))['lat'].min()
-                    sp_latmax = sp.df.where(pd.notna(sp.df[sp.df.columns[-1]]))['lat'].max()
-
-                    latmin = max(latmin, sp_latmin - sp_latdelta)
-                    latmax = min(latmax, sp_latmax + sp_latdelta)
+                    sp_bbox = self.get_bbox(sp)
+                    if sp_bbox is not None:
+                        sp_lonmin, sp_lonmax, sp_latmin, sp_latmax = sp_bbox
+                        lonmin, lonmax = max(lonmin, sp_lonmin), min(lonmax, sp_lonmax)
+                        latmin, latmax = max(latmin, sp_latmin), min(latmax, sp_latmax)
 
                 ratio = max((lonmax - lonmin) / (latmax - latmin), 1.0)
 
@@ -66,14 +104,11 @@ class MapPlot(FigurePlotMixin, GridPlotMixin, Plot):
                         vmin = self.get_vmin(sp, subplots)
                         vmax = self.get_vmax(sp, subplots)
 
-                        df_pivot = sp.df.pivot(index='lat', columns=['lon'], values=sp.var)
-                        df_pivot = df_pivot.reindex(index=df_pivot.index[::-1])
-
-                        # truncate the dataframe at the extensions
-                        df_pivot = df_pivot.truncate(before=latmin, after=latmax)
-                        df_pivot = df_pivot.truncate(before=lonmin, after=lonmax, axis=1)
+                        # cut the map at the extensions, the latitudes are ascending
+                        da = self.get_map(sp).sel(lat=slice(latmin, latmax), lon=slice(lonmin, lonmax))
+                        values = self.decimate(da.values, ax) if settings.MAP_DECIMATION else da.values
 
-                        im = ax.imshow(df_pivot, interpolation='nearest', label=sp.label,
+                        im = ax.imshow(values, interpolation='nearest', label=sp.label, origin='lower',
                                        extent=[lonmin, lonmax, latmin, latmax],
                                        vmin=vmin, vmax=vmax, cmap=settings.CMAP)
 
@@ -11,10 +11,14 @@ class MonthOfYearPlot(FigurePlotMixin, GridPlotMixin, Plot):
 
     specifier = 'monthofyear'
     extractions = ['mean']
+    aggregates = ['monthly']
 
     def get_df(self, dataset):
         extraction = self.extraction_class(dataset, self.region, self.period)
-        df = extraction.read().groupby(lambda x: x.month).mean()
+        df_mean, _, df_count = extraction.read_aggregate('monthly')
+
+        # combine the months of all years
+        df = (df_mean * df_count).groupby(level='month').sum() / df_count.groupby(level='month').sum()
         mean, std =  df.mean().values, df.std().values
         return (df - mean) / (std if std > 0 else 1.0)
 
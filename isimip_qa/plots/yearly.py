@@ -11,14 +11,14 @@ class YearlyPlot(FigurePlotMixin, GridPlotMixin, Plot):
 
     specifier = 'yearly'
     extractions = ['mean']
+    aggregates = ['yearly']
 
     def get_df(self, dataset):
         extraction = self.extraction_class(dataset, self.region, self.period)
-        df = extraction.read()
-        df_std = df.groupby(lambda x: x.year).std()
-        df_mean = df.groupby(lambda x: x.year).mean()
-        df_mean.insert(0, 'std', df_std)
-        return df_mean
+        df_mean, df_std, _ = extraction.read_aggregate('yearly')
+        df = df_mean.copy()
+        df.insert(0, 'std', df_std)
+        return df
 
     def get_attrs(self, dataset):
         return AttrsExtraction(dataset, self.region, self.period).read()
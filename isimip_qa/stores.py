@@ -0,0 +1,145 @@
+import logging
+import os
+import sqlite3
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class FileStore:
+
+    def exists(self, path):
+        return path.exists()
+
+    def read(self, path):
+        return path.read_bytes()
+
+    def get_version(self, path):
+        stat = path.stat()
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def write(self, path, data, key=None):
+        path.parent.mkdir(exist_ok=True, parents=True)
+
+        # write to a temporary file first, so that an interrupted run does not leave a broken file
+        tmp_path = path.with_name(f'{path.name}.{os.getpid()}')
+        tmp_path.write_bytes(data)
+        tmp_path.replace(path)
+
+    def append(self, path, data):
+        with path.open('ab') as fp:
+            fp.write(data)
+
+
+class SQLiteStore:
+
+    def __init__(self, path, read_only=False):
+        self.path = path
+
+        if read_only:
+            # the database is not changed and not created, missing tables are created as temporary tables
+            if self.path.exists():
+                self.connection = sqlite3.connect(f'{self.path.resolve().as_uri()}?mode=ro', uri=True)
+            else:
+                self.connection = sqlite3.connect(':memory:')
+        else:
+            self.path.parent.mkdir(exist_ok=True, parents=True)
+            self.connection = sqlite3.connect(self.path)
+
+        table = 'TEMP TABLE' if read_only else 'TABLE'
+        tables = {name for name, in self.connection.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        with self.connection:
+            if 'files' not in tables:
+                self.connection.execute(
+                    f'CREATE {table} files ('
+                    'name TEXT PRIMARY KEY, extraction TEXT, region TEXT, period TEXT, data BLOB NOT NULL)'
+                )
+                self.connection.execute('CREATE INDEX files_key ON files (extraction, region, period)')
+
+            if 'chunks' not in tables:
+                # appended data is stored as chunks, which are joined with the data of the file when it is read
+                self.connection.execute(f'CREATE {table} chunks (name TEXT NOT NULL, data BLOB NOT NULL)')
+                self.connection.execute('CREATE INDEX chunks_name ON chunks (name)')
+
+        # the names are read at once, so that checking if an extraction exists does not need a query
+        self.names = {name for name, in self.connection.execute('SELECT name FROM files')}
+
+    def exists(self, path):
+        return path.name in self.names
+
+    def read(self, path):
+        row = self.connection.execute('SELECT data FROM files WHERE name = ?', (path.name, )).fetchone()
+        if row is None:
+            raise FileNotFoundError(f'{path.name} not found in {self.path}')
+        return self.join(path.name, row[0])
+
+    def join(self, name, data):
+        chunks = self.connection.execute('SELECT data FROM chunks WHERE name = ? ORDER BY rowid', (name, ))
+        return b''.join([data, *(chunk for chunk, in chunks)])
+
+    def get_version(self, path):
+        # the file of the database changes with every write
+        if path.name not in self.names:
+            raise FileNotFoundError(f'{path.name} not found in {self.path}')
+        return self.path.stat().st_mtime_ns
+
+    def get(self, extraction, region, period):
+        # read an extraction using the index, files without key (e.g. manifests) are not found
+        row = self.connection.execute(
+            'SELECT name, data FROM files WHERE extraction = ? AND region = ? AND period = ?',
+            (extraction, region, period)
+        ).fetchone()
+        if row is None:
+            raise FileNotFoundError(f'{extraction} {region} {period} not found in {self.path}')
+        return self.join(*row)
+
+    def write(self, path, data, key=None):
+        with self.connection:
+            self.connection.execute('DELETE FROM chunks WHERE name = ?', (path.name, ))
+            if key is None:
+                self.connection.execute(
+                    'INSERT INTO files (name, data) VALUES (?, ?) '
+                    'ON CONFLICT (name) DO UPDATE SET data = excluded.data', (path.name, data)
+                )
+            else:
+                self.connection.execute(
+                    'INSERT INTO files (name, extraction, region, period, data) VALUES (?, ?, ?, ?, ?) '
+                    'ON CONFLICT (name) DO UPDATE SET extraction = excluded.extraction, region = excluded.region, '
+                    'period = excluded.period, data = excluded.data', (path.name, *key, data)
+                )
+
+        self.names.add(path.name)
+
+    def append(self, path, data):
+        # the existing data is not read, so that appending does not get slower with the size of the file
+        if path.name not in self.names:
+            raise FileNotFoundError(f'{path.name} not found in {self.path}')
+
+        with self.connection:
+            self.connection.execute('INSERT INTO chunks (name, data) VALUES (?, ?)', (path.name, data))
+
+    def export(self):
+        # write the files of the store to the layout of separate files next to the store
+        for name, data in self.connection.execute('SELECT name, data FROM files').fetchall():
+            logger.info(f'export {name} from {self.path}')
+            FileStore().write(self.path.with_name(name), self.join(name, data))
+
+    def close(self):
+        self.connection.close()
+
+
+file_store = FileStore()
+
+
+def get_store(dataset):
+    if settings.EXTRACTIONS_STORE:
+        path = settings.EXTRACTIONS_PATH / dataset.path.with_name(dataset.path.name + '.sqlite')
+        try:
+            return settings.STORES[path]
+        except KeyError:
+            # the plan does not change the stores
+            store = settings.STORES[path] = SQLiteStore(path, read_only=bool(settings.PLAN))
+            return store
+    else:
+        return file_store
@@ -0,0 +1,87 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from isimip_qa.accumulators import Aggregate, Histogram
+
+rng = np.random.default_rng(42)
+
+
+@pytest.mark.parametrize('values', [
+    rng.normal(size=10000),
+    rng.uniform(-1, 1, size=10000),
+    np.linspace(0, 1, 1001)
+])
+def test_histogram(values):
+    histogram = Histogram()
+    histogram.add(values)
+
+    counts, bins = np.histogram(values, bins=np.linspace(values.min(), values.max(), 101))
+
+    df = histogram.to_df()
+    assert (df.index.values == bins[:-1]).all()
+    assert (df['count'].values == counts).all()
+
+
+def test_histogram_extend():
+    values = rng.normal(size=10000)
+
+    histogram = Histogram(-1, 1)
+    histogram.add(values)
+
+    df = histogram.to_df()
+    assert df['count'].sum() == values.size
+    assert df.index.min() <= values.min()
+    assert df.index.max() + histogram.step > values.max()
+
+
+def test_histogram_merge():
+    values = rng.normal(size=10000)
+
+    histogram = Histogram(-1, 1)
+    histogram.add(values)
+
+    merged_histogram = Histogram()
+    for chunk in np.array_split(values, 7):
+        chunk_histogram = Histogram(-1, 1)
+        chunk_histogram.add(chunk)
+        merged_histogram.merge(chunk_histogram)
+
+    assert histogram.to_df().equals(merged_histogram.to_df())
+
+    with pytest.raises(ValueError):
+        merged_histogram.merge(Histogram(-2, 2))
+
+
+def test_histogram_single_value():
+    histogram = Histogram()
+    histogram.add(np.ones(10))
+
+    df = histogram.to_df()
+    assert (df.index.values == 1).all()
+    assert df['count'].values[-1] == 10
+
+    histogram.add(np.array([0.0, 2.0]))
+
+    df = histogram.to_df()
+    assert df['count'].sum() == 12
+    assert df['count'].values[0] == 1
+
+
+def test_aggregate():
+    df = pd.DataFrame({
+        'var': rng.normal(size=1000)
+    }, index=pd.date_range('2000-01-01', periods=1000, name='time'))
+    df.iloc[::7] = np.nan
+
+    # add the values in parts, which split the years
+    aggregate = Aggregate()
+    for start in range(0, 1000, 300):
+        part = df.iloc[start:start + 300]
+        aggregate.add(part, [pd.Index(part.index.year, name='year')])
+
+    grouped = df.groupby(pd.Index(df.index.year, name='year'))
+    aggregate_df = aggregate.to_df()
+    pd.testing.assert_series_equal(aggregate_df['var'], grouped.mean()['var'])
+    pd.testing.assert_series_equal(aggregate_df['var_std'], grouped.std()['var'].rename('var_std'))
+    pd.testing.assert_series_equal(aggregate_df['var_count'], grouped.count()['var'].rename('var_count'))
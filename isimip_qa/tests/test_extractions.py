@@ -1,13 +1,18 @@
+import importlib
+import inspect
+import pkgutil
 import shutil
 from pathlib import Path
 
 import numpy as np
 import pandas as pd
 import pytest
+import xarray as xr
 
-from isimip_qa.extractions import extraction_classes
+from isimip_qa import extractions
+from isimip_qa.extractions import CountExtraction, MeanExtraction, extraction_classes
 from isimip_qa.main import init_settings
-from isimip_qa.models import Dataset
+from isimip_qa.models import Dataset, Extraction
 
 datasets = [
     'linear',
@@ -59,3 +64,170 @@ def test_extraction(settings, dataset_path, extraction_class):
         cdo_df = pd.read_csv(cdo_path, delim_whitespace=True, names=['time', 'var'])
         cdo_df['var'] = cdo_df['var'].astype(np.float64)
         pd.testing.assert_frame_equal(df, cdo_df)
+
+
+@pytest.mark.parametrize('dataset_path', ['mask', 'sine'])
+@pytest.mark.parametrize('extraction_class', extraction_classes)
+def test_extraction_chunks(settings, dataset_path, extraction_class):
+    dataset = Dataset(dataset_path)
+
+    dfs = []
+    for chunks in [None, 'time=30', 'auto']:
+        init_settings(
+            datasets_path=settings.DATASETS_PATH,
+            extractions_path=settings.EXTRACTIONS_PATH,
+            chunks=chunks
+        )
+
+        extraction = extraction_class(dataset)
+        extraction.path.unlink(missing_ok=True)
+
+        for file in dataset.files:
+            file.open()
+            extraction.extract(file)
+            file.close()
+
+        if extraction.path.suffix == '.csv':
+            dfs.append(pd.read_csv(extraction.path))
+
+    for df in dfs[1:]:
+        pd.testing.assert_frame_equal(dfs[0], df)
+
+
+@pytest.mark.parametrize('dataset_path', ['mask', 'point'])
+@pytest.mark.parametrize('extraction_class', extraction_classes)
+def test_extraction_formats(settings, dataset_path, extraction_class):
+    dataset = Dataset(dataset_path)
+
+    dfs = []
+    for extractions_format in ['csv', 'parquet', 'feather', 'netcdf']:
+        if extractions_format in ['parquet', 'feather']:
+            pytest.importorskip('pyarrow')
+
+        init_settings(
+            datasets_path=settings.DATASETS_PATH,
+            extractions_path=settings.EXTRACTIONS_PATH,
+            extractions_format=extractions_format
+        )
+
+        extraction = extraction_class(dataset)
+        if not extraction.has_region(extraction.region) or extraction.path.suffix == '.json':
+            pytest.skip()
+
+        extraction.path.unlink(missing_ok=True)
+
+        for file in dataset.files:
+            file.open()
+            extraction.extract(file)
+            file.close()
+
+        dfs.append(extraction.read())
+
+    for df in dfs[1:]:
+        pd.testing.assert_frame_equal(dfs[0], df, check_dtype=False)
+
+
+@pytest.mark.parametrize('extraction_class', [CountExtraction, MeanExtraction])
+def test_extraction_formats_files(settings, tmp_path, extraction_class):
+    # split the dataset into three files on a smaller grid
+    with xr.open_dataset(Path('testing') / 'datasets' / 'linear.nc') as ds:
+        ds = ds.isel(lat=slice(100, 160), lon=slice(300, 380)).load()
+    for index, (start, stop) in enumerate([(0, 40), (40, 70), (70, 100)]):
+        ds.isel(time=slice(start, stop)).to_netcdf(tmp_path / f'linear_{index}.nc')
+
+    dfs = []
+    for extractions_format in ['csv', 'parquet', 'feather', 'netcdf']:
+        if extractions_format in ['parquet', 'feather']:
+            pytest.importorskip('pyarrow')
+
+        init_settings(
+            datasets_path=tmp_path,
+            extractions_path=tmp_path / 'extractions',
+            extractions_format=extractions_format
+        )
+
+        # the rows of all files are written, without calling extraction.finish
+        dataset = Dataset('linear')
+        extraction = extraction_class(dataset)
+        for file in dataset.files:
+            file.open()
+            extraction.extract(file)
+            file.close()
+
+        dfs.append(extraction.read())
+
+    assert len(dfs[0]) == 100
+    for df in dfs[1:]:
+        pd.testing.assert_frame_equal(dfs[0], df, check_dtype=False)
+
+
+@pytest.mark.parametrize('calendar', [None, '360_day'])
+def test_extraction_read_time(settings, calendar):
+    init_settings(
+        datasets_path=settings.DATASETS_PATH,
+        extractions_path=settings.EXTRACTIONS_PATH,
+        cftime=calendar
+    )
+
+    extraction = MeanExtraction(Dataset('linear'))
+    extraction.path.parent.mkdir(exist_ok=True, parents=True)
+    extraction.path.write_text('time,var\n1601-01-01,1.0\n2000-02-30,2.0\n2100-12-30 12:00:00,3.0\nunknown,4.0\n')
+
+    df = extraction.read()
+
+    if calendar is None:
+        # the invalid date is removed, but dates before 1677 are kept
+        assert list(df.index.year) == [1601, 2100]
+        assert list(df['var']) == [1.0, 3.0]
+    else:
+        assert list(df.index.year) == [1601, 2000, 2100]
+        assert list(df.index.day) == [1, 30, 30]
+        assert list(df['var']) == [1.0, 2.0, 3.0]
+        assert df.index.calendar == calendar
+
+
+def test_extraction_read_cache(settings):
+    read_settings = init_settings(
+        datasets_path=settings.DATASETS_PATH,
+        extractions_path=settings.EXTRACTIONS_PATH,
+        read_cache_size=1
+    )
+
+    extraction = MeanExtraction(Dataset('linear'))
+    extraction.path.parent.mkdir(exist_ok=True, parents=True)
+    extraction.path.write_text('time,var\n2000-01-01,1.0\n2000-01-02,2.0\n')
+
+    df = extraction.read()
+    df['var'] = 0.0
+
+    # the file is parsed once and the cached dataframe is not changed by the caller
+    assert list(extraction.read()['var']) == [1.0, 2.0]
+    assert (read_settings.READ_CACHE.hits, read_settings.READ_CACHE.misses) == (1, 1)
+
+    # a changed file is read again
+    extraction.path.write_text('time,var\n2000-01-01,1.0\n2000-01-02,2.0\n2000-01-03,3.0\n')
+    assert list(extraction.read()['var']) == [1.0, 2.0, 3.0]
+    assert (read_settings.READ_CACHE.hits, read_settings.READ_CACHE.misses) == (1, 2)
+
+    # the size of the cache is limited
+    read_settings.READ_CACHE.max_size = 0
+    extraction.path.write_text('time,var\n2000-01-01,1.0\n')
+    assert list(extraction.read()['var']) == [1.0]
+    assert read_settings.READ_CACHE.size == 0
+    assert not read_settings.READ_CACHE.entries
+
+
+def test_extraction_registry():
+    # the registry needs to list every extraction class of the modules in the package
+    module_classes = set()
+    for module_info in pkgutil.iter_modules(extractions.__path__):
+        module = importlib.import_module(f'{extractions.__name__}.{module_info.name}')
+        for module_class in vars(module).values():
+            if (
+                inspect.isclass(module_class) and issubclass(module_class, Extraction)
+                and module_class.__module__ == module.__name__
+            ):
+                module_classes.add(module_class)
+
+    assert module_classes == set(extraction_classes)
+    assert [extraction_class.specifier for extraction_class in extraction_classes] == list(extractions.registry)
@@ -0,0 +1,666 @@
+import hashlib
+import http.server
+import json
+import shutil
+import socket
+import subprocess
+import sys
+import threading
+import zipfile
+from collections import Counter
+from pathlib import Path
+
+import pandas as pd
+import pytest
+import xarray as xr
+
+from isimip_utils.checksum import get_checksum
+
+import isimip_qa.main
+import isimip_qa.models
+from isimip_qa import __version__
+from isimip_qa.extractions import CountExtraction, MeanExtraction
+from isimip_qa.formats import ParquetFormat
+from isimip_qa.main import extract_dataset_job, get_plot, get_plots, get_regions, init_settings, main
+from isimip_qa.models import Dataset
+from isimip_qa.stores import SQLiteStore
+from isimip_qa.utils import get_time_groups
+
+datasets = [
+    'linear',
+    'mask'
+]
+
+
+def get_parts():
+    # split the datasets into three files on a smaller grid
+    parts = {}
+    for dataset in datasets:
+        with xr.open_dataset(Path('testing') / 'datasets' / f'{dataset}.nc') as ds:
+            ds = ds.isel(lat=slice(100, 160), lon=slice(300, 380)).load()
+        parts[dataset] = [ds.isel(time=slice(start, stop)) for start, stop in [(0, 40), (40, 70), (70, 100)]]
+    return parts
+
+
+def assert_extractions(path, reference_path):
+    reference_files = sorted(file_path.relative_to(reference_path) for file_path in reference_path.rglob('*.csv'))
+    assert reference_files
+    for file_path in reference_files:
+        df = pd.read_csv(path / file_path)
+        reference_df = pd.read_csv(reference_path / file_path)
+        pd.testing.assert_frame_equal(df, reference_df, check_dtype=False)
+
+
+@pytest.fixture()
+def run(monkeypatch):
+    def run(*args):
+        monkeypatch.setattr(sys, 'argv', ['isimip-qa', *args])
+        main()
+
+    return run
+
+
+def test_main_jobs(run):
+    serial_path = Path('testing') / 'tmp' / 'serial'
+    jobs_path = Path('testing') / 'tmp' / 'jobs'
+
+    shutil.rmtree(serial_path, ignore_errors=True)
+    shutil.rmtree(jobs_path, ignore_errors=True)
+
+    args = [*datasets, '--datasets-path', 'testing/datasets', '--extractions-locations', '', '--extractions-only']
+    run(*args, '--extractions-path', str(serial_path))
+    run(*args, '--extractions-path', str(jobs_path), '--jobs', '2')
+
+    serial_files = sorted(path.relative_to(serial_path) for path in serial_path.rglob('*') if path.is_file())
+    jobs_files = sorted(path.relative_to(jobs_path) for path in jobs_path.rglob('*') if path.is_file())
+
+    assert serial_files
+    assert serial_files == jobs_files
+    for path in serial_files:
+        assert (serial_path / path).read_bytes() == (jobs_path / path).read_bytes()
+
+
+def test_main_plot_jobs(run):
+    serial_path = Path('testing') / 'tmp' / 'plots-serial'
+    jobs_path = Path('testing') / 'tmp' / 'plots-jobs'
+
+    shutil.rmtree(serial_path, ignore_errors=True)
+    shutil.rmtree(jobs_path, ignore_errors=True)
+
+    args = [*datasets, '--datasets-path', 'testing/datasets', '--extractions-path', 'testing/extractions',
+            '--extractions-locations', '', '--plots-only', '--plots-format', 'png']
+    run(*args, '--plots-path', str(serial_path))
+    run(*args, '--plots-path', str(jobs_path), '--plot-jobs', '2')
+
+    serial_files = sorted(path.relative_to(serial_path) for path in serial_path.rglob('*') if path.is_file())
+    jobs_files = sorted(path.relative_to(jobs_path) for path in jobs_path.rglob('*') if path.is_file())
+
+    assert serial_files
+    assert serial_files == jobs_files
+    for path in serial_files:
+        assert (serial_path / path).read_bytes() == (jobs_path / path).read_bytes()
+
+
+def test_main_extract_dataset_job(monkeypatch):
+    extractions_path = Path('testing') / 'tmp' / 'dataset-jobs'
+    shutil.rmtree(extractions_path, ignore_errors=True)
+
+    init_settings(datasets_path='testing/datasets', extractions_path=str(extractions_path),
+                  paths=datasets, extractions='count', regions='global')
+
+    # the regions are created once for all tasks of a worker
+    calls = []
+
+    def count_get_regions():
+        calls.append(True)
+        return get_regions()
+
+    monkeypatch.setattr(isimip_qa.main, 'get_regions', count_get_regions)
+
+    for dataset in datasets:
+        extract_dataset_job(dataset)
+
+    assert len(calls) == 1
+    assert all((extractions_path / f'{dataset}_global_count.csv').exists() for dataset in datasets)
+
+
+def test_main_get_plot(monkeypatch):
+    init_settings(datasets_path='testing/datasets', extractions_path='testing/extractions',
+                  paths=datasets, extractions='mean', plots='yearly,monthofyear')
+
+    # the plots are created once for all tasks of a worker
+    calls = []
+
+    def count_get_plots(*args):
+        calls.append(args)
+        return get_plots(*args)
+
+    monkeypatch.setattr(isimip_qa.main, 'get_plots', count_get_plots)
+
+    plots = [get_plot((specifier, 'mean', 'global', ('auto', ))) for specifier in ['yearly', 'monthofyear']]
+    assert [plot.specifier for plot in plots] == ['yearly', 'monthofyear']
+    assert get_plot(plots[0].key) is plots[0]
+    assert len(calls) == 1
+
+
+def test_main_plot_cache(run):
+    extractions_path = Path('testing') / 'tmp' / 'plot-cache-extractions'
+    plots_path = Path('testing') / 'tmp' / 'plot-cache'
+
+    shutil.rmtree(extractions_path, ignore_errors=True)
+    shutil.rmtree(plots_path, ignore_errors=True)
+    shutil.copytree(Path('testing') / 'extractions', extractions_path)
+
+    def plot(*args):
+        run(*datasets, '--datasets-path', 'testing/datasets', '--extractions-path', str(extractions_path),
+            '--extractions-locations', '', '--plots-path', str(plots_path), '--plots-only', *args)
+        return {path.name: path.stat().st_mtime_ns for path in plots_path.iterdir() if path.suffix == '.svg'}
+
+    figures = plot()
+    assert figures
+
+    # nothing changed, so no figure is created again
+    assert plot() == figures
+
+    # only the figures of the changed extraction are created again
+    df = pd.read_csv(extractions_path / 'mask_global_count.csv')
+    df['var'] = df['var'] * 2
+    df.to_csv(extractions_path / 'mask_global_count.csv', index=False)
+
+    changed_figures = plot()
+    assert {name for name in figures if changed_figures[name] != figures[name]} == {'linear_global_count_daily.svg'}
+
+    # the figures which read an aggregate are created again if the aggregate changes
+    extraction = MeanExtraction(Dataset('mask'))
+    extraction.aggregate(extraction.read() * 2)
+    extraction.format.write(extraction.store, extraction.get_aggregate_path('yearly'),
+                            extraction.aggregates['yearly'].to_df(), key=extraction.get_aggregate_key('yearly'))
+
+    aggregate_figures = plot()
+    assert {name for name in figures if aggregate_figures[name] != changed_figures[name]} == \
+        {'linear_global_mean_yearly.svg'}
+    changed_figures = aggregate_figures
+
+    # all figures are created again with --force-plots
+    forced_figures = plot('--force-plots')
+    assert all(forced_figures[name] != changed_figures[name] for name in figures)
+
+
+def test_main_aggregates(run):
+    extractions_path = Path('testing') / 'tmp' / 'aggregates'
+
+    shutil.rmtree(extractions_path, ignore_errors=True)
+
+    run(*datasets, '--datasets-path', 'testing/datasets', '--extractions-locations', '',
+        '--extractions-path', str(extractions_path), '--extractions-only', '--extractions', 'mean,count')
+
+    # the aggregates written during the extraction match the aggregates of the full time series
+    for dataset in datasets:
+        for extraction_class in [CountExtraction, MeanExtraction]:
+            extraction = extraction_class(Dataset(dataset))
+            df = extraction.read()
+            for resolution in extraction.resolutions:
+                assert extraction.get_aggregate_path(resolution).exists()
+
+                grouped = df.groupby(get_time_groups(df.index, resolution))
+                mean, std, count = extraction.read_aggregate(resolution)
+                pd.testing.assert_frame_equal(mean, grouped.mean(), check_dtype=False, check_index_type=False)
+                pd.testing.assert_frame_equal(std, grouped.std(), check_dtype=False, check_index_type=False)
+                pd.testing.assert_frame_equal(count, grouped.count(), check_dtype=False, check_index_type=False)
+
+
+def test_main_jobs_failure(run):
+    extractions_path = Path('testing') / 'tmp' / 'failure'
+
+    shutil.rmtree(extractions_path, ignore_errors=True)
+
+    with pytest.raises(SystemExit) as e:
+        # a regular file as extractions path lets the workers fail
+        extractions_path.parent.mkdir(exist_ok=True, parents=True)
+        extractions_path.touch()
+        run('linear', '--datasets-path', 'testing/datasets', '--extractions-locations', '',
+            '--extractions-path', str(extractions_path), '--extractions-only', '--jobs', '2')
+
+    assert e.value.code == 1
+    extractions_path.unlink()
+
+
+def test_main_manifest(run):
+    datasets_path = Path('testing') / 'tmp' / 'manifest' / 'datasets'
+    extractions_path = Path('testing') / 'tmp' / 'manifest' / 'extractions'
+    reference_path = Path('testing') / 'tmp' / 'manifest' / 'reference'
+
+    shutil.rmtree(datasets_path.parent, ignore_errors=True)
+    datasets_path.mkdir(parents=True)
+
+    parts = get_parts()
+
+    def write_part(dataset, index):
+        parts[dataset][index].to_netcdf(datasets_path / f'{dataset}_{index}.nc')
+
+    def assert_reference():
+        shutil.rmtree(reference_path, ignore_errors=True)
+        run(*args, '--extractions-path', str(reference_path))
+        assert_extractions(extractions_path, reference_path)
+
+    args = [*datasets, '--datasets-path', str(datasets_path), '--extractions-locations', '', '--extractions-only']
+
+    # extract the first two files, then add the third file
+    for dataset in datasets:
+        write_part(dataset, 0)
+        write_part(dataset, 1)
+    run(*args, '--extractions-path', str(extractions_path))
+
+    for dataset in datasets:
+        write_part(dataset, 2)
+    run(*args, '--extractions-path', str(extractions_path))
+    assert_reference()
+
+    # change the second file
+    for dataset in datasets:
+        parts[dataset][1] = parts[dataset][1] + 1
+        write_part(dataset, 1)
+    run(*args, '--extractions-path', str(extractions_path))
+    assert_reference()
+
+    manifest = json.loads((extractions_path / 'linear_global_mean.manifest.json').read_text())
+    assert list(manifest['files']) == ['linear_0.nc', 'linear_1.nc', 'linear_2.nc']
+    assert [entry['rows'] for entry in manifest['files'].values()] == [40, 30, 30]
+
+    # remove the third file, the manifest and the aggregates are updated without extracting any file
+    for dataset in datasets:
+        (datasets_path / f'{dataset}_2.nc').unlink()
+    run(*args, '--extractions-path', str(extractions_path))
+    assert_reference()
+
+    manifest = json.loads((extractions_path / 'linear_global_mean.manifest.json').read_text())
+    assert list(manifest['files']) == ['linear_0.nc', 'linear_1.nc']
+
+
+def test_main_manifest_checksums(run, monkeypatch):
+    datasets_path = Path('testing') / 'tmp' / 'manifest-checksums' / 'datasets'
+    extractions_path = Path('testing') / 'tmp' / 'manifest-checksums' / 'extractions'
+
+    shutil.rmtree(datasets_path.parent, ignore_errors=True)
+    datasets_path.mkdir(parents=True)
+
+    parts = get_parts()
+    for index in range(3):
+        parts['linear'][index].to_netcdf(datasets_path / f'linear_{index}.nc')
+
+    calls = []
+
+    def count_get_checksum(path):
+        calls.append(path)
+        return get_checksum(path)
+
+    monkeypatch.setattr(isimip_qa.models, 'get_checksum', count_get_checksum)
+
+    args = ['linear', '--datasets-path', str(datasets_path), '--extractions-path', str(extractions_path),
+            '--extractions-locations', '', '--extractions-only', '--manifest-checksums']
+
+    # the checksum of every file is computed once for all extractions
+    run(*args, '--extractions', 'count,mean')
+    assert len(calls) == 3
+
+    # touched files are compared using their checksum, again once per file
+    calls.clear()
+    for file_path in datasets_path.iterdir():
+        file_path.touch()
+    run(*args, '--extractions', 'count,mean')
+    assert len(calls) == 3
+
+
+def test_main_formats(run, monkeypatch):
+    pytest.importorskip('pyarrow')
+
+    datasets_path = Path('testing') / 'tmp' / 'formats' / 'datasets'
+    csv_path = Path('testing') / 'tmp' / 'formats' / 'csv'
+    parquet_path = Path('testing') / 'tmp' / 'formats' / 'parquet'
+
+    shutil.rmtree(datasets_path.parent, ignore_errors=True)
+    datasets_path.mkdir(parents=True)
+
+    parts = get_parts()
+    for dataset in datasets:
+        for index in range(3):
+            parts[dataset][index].to_netcdf(datasets_path / f'{dataset}_{index}.nc')
+
+    args = [*datasets, '--datasets-path', str(datasets_path), '--extractions-locations', '', '--extractions-only']
+    run(*args, '--extractions-path', str(csv_path))
+
+    # the rows of the time series are not written again for every file
+    writes = Counter()
+    write = ParquetFormat.write
+
+    def count_write(self, store, path, df, append=False, key=None):
+        writes[path.name] += 1
+        return write(self, store, path, df, append=append, key=key)
+
+    monkeypatch.setattr(ParquetFormat, 'write', count_write)
+    run(*args, '--extractions-path', str(parquet_path), '--extractions-format', 'parquet')
+
+    assert writes['linear_global_mean.parquet'] == 2
+    for csv_file_path in csv_path.glob('*.csv'):
+        df = pd.read_csv(csv_file_path)
+        parquet_df = pd.read_parquet(parquet_path / csv_file_path.with_suffix('.parquet').name)
+        if 'time' in df:
+            df['time'] = pd.to_datetime(df['time'])
+        pd.testing.assert_frame_equal(parquet_df, df, check_dtype=False)
+
+
+def test_main_checkpoint(run):
+    datasets_path = Path('testing') / 'tmp' / 'checkpoint' / 'datasets'
+    extractions_path = Path('testing') / 'tmp' / 'checkpoint' / 'extractions'
+    reference_path = Path('testing') / 'tmp' / 'checkpoint' / 'reference'
+
+    shutil.rmtree(datasets_path.parent, ignore_errors=True)
+    datasets_path.mkdir(parents=True)
+
+    parts = get_parts()
+    for dataset in datasets:
+        for index in range(2):
+            parts[dataset][index].to_netcdf(datasets_path / f'{dataset}_{index}.nc')
+
+        # a broken last file interrupts the extraction
+        (datasets_path / f'{dataset}_2.nc').write_text('broken')
+
+    args = [*datasets, '--datasets-path', str(datasets_path), '--extractions-locations', '', '--extractions-only']
+
+    with pytest.raises(ValueError):
+        run(*args, '--extractions-path', str(extractions_path), '--checkpoint', '1')
+
+    assert (extractions_path / 'linear_global_meanmap.checkpoint.npz').exists()
+    assert (extractions_path / 'linear_global_histogram.checkpoint.npz').exists()
+    assert (extractions_path / 'linear_global_mean.manifest.json').exists()
+
+    for dataset in datasets:
+        parts[dataset][2].to_netcdf(datasets_path / f'{dataset}_2.nc')
+
+    run(*args, '--extractions-path', str(extractions_path), '--resume')
+    assert not list(extractions_path.glob('*.checkpoint.npz'))
+
+    run(*args, '--extractions-path', str(reference_path))
+    assert_extractions(extractions_path, reference_path)
+
+
+def test_main_store(run, capsys):
+    files_path = Path('testing') / 'tmp' / 'files'
+    store_path = Path('testing') / 'tmp' / 'store'
+
+    shutil.rmtree(files_path, ignore_errors=True)
+    shutil.rmtree(store_path, ignore_errors=True)
+
+    args = [*datasets, '--datasets-path', 'testing/datasets', '--extractions-locations', '', '--extractions-only']
+    run(*args, '--extractions-path', str(files_path))
+    run(*args, '--extractions-path', str(store_path), '--extractions-store')
+
+    # the extractions of each dataset are in one file
+    assert sorted(path.name for path in store_path.iterdir()) == [f'{dataset}.sqlite' for dataset in datasets]
+
+    store = SQLiteStore(store_path / 'linear.sqlite')
+    assert store.get('mean', 'global', 'auto') == (files_path / 'linear_global_mean.csv').read_bytes()
+
+    # the plan reads the stores, but does not change them
+    mtime = (store_path / 'linear.sqlite').stat().st_mtime_ns
+    capsys.readouterr()
+    run(*args, '--extractions-path', str(store_path), '--extractions-store', '--plan')
+    assert '0 fetchable, 0 to compute' in capsys.readouterr().out
+    assert (store_path / 'linear.sqlite').stat().st_mtime_ns == mtime
+
+    # the time series of the files are appended as chunks, which are joined when the extraction is read
+    datasets_path = Path('testing') / 'tmp' / 'store-parts' / 'datasets'
+    parts_path = Path('testing') / 'tmp' / 'store-parts' / 'extractions'
+    shutil.rmtree(datasets_path.parent, ignore_errors=True)
+    datasets_path.mkdir(parents=True)
+
+    parts = get_parts()
+    for index in range(3):
+        parts['linear'][index].to_netcdf(datasets_path / f'linear_{index}.nc')
+
+    parts_args = ['linear', '--datasets-path', str(datasets_path), '--extractions-locations', '',
+                  '--extractions-only', '--extractions-path', str(parts_path)]
+    run(*parts_args)
+    run(*parts_args, '--extractions-store', '--force')
+
+    store = SQLiteStore(parts_path / 'linear.sqlite')
+    chunks = store.connection.execute('SELECT COUNT(*) FROM chunks WHERE name = ?', ('linear_global_mean.csv', ))
+    assert chunks.fetchone() == (2, )
+    assert store.get('mean', 'global', 'auto') == (parts_path / 'linear_global_mean.csv').read_bytes()
+    store.close()
+
+    # the extractions are exported to separate files, without extracting again
+    run(*args, '--extractions-path', str(store_path), '--extractions-store', '--extractions-export')
+
+    files = sorted(path.relative_to(files_path) for path in files_path.rglob('*') if path.is_file())
+    assert files
+    for path in files:
+        assert (store_path / path).read_bytes() == (files_path / path).read_bytes()
+
+
+def test_main_fetch(run):
+    extractions_path = Path('testing') / 'tmp' / 'fetch'
+    removed_path = Path('testing') / 'tmp' / 'fetch-removed'
+    cache_path = Path('testing') / 'tmp' / 'fetch-cache'
+
+    shutil.rmtree(extractions_path, ignore_errors=True)
+    shutil.rmtree(removed_path, ignore_errors=True)
+    shutil.rmtree(cache_path, ignore_errors=True)
+
+    # serve the testing extractions with a local http server, which records the requests
+    requests = []
+
+    class Handler(http.server.SimpleHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, directory='testing/extractions', **kwargs)
+
+        def log_request(self, code='-', size='-'):
+            requests.append((self.client_address, self.path, int(code)))
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    def fetch(path=extractions_path):
+        run(*datasets, '--datasets-path', 'testing/datasets', '--extractions-path', str(path),
+            '--extractions-locations', f'http://127.0.0.1:{server.server_port}/', '--extractions-only',
+            '--fetch-jobs', '4', '--cache-path', str(cache_path))
+
+    try:
+        fetch()
+        first_requests = requests[:]
+
+        # fetch again, the missing files are not requested and the others are not downloaded again
+        shutil.rmtree(extractions_path)
+        requests.clear()
+        fetch()
+        second_requests = requests[:]
+
+        # remove the content from the cache, but keep its index
+        for content_path in (cache_path / 'fetch').iterdir():
+            if content_path.name != 'index.json':
+                content_path.unlink()
+
+        requests.clear()
+        fetch(removed_path)
+        removed_requests = requests[:]
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    files = sorted(path.name for path in Path('testing/extractions').iterdir()
+                   if path.name.startswith(tuple(f'{dataset}_' for dataset in datasets)))
+    assert files
+    for file_name in files:
+        assert (extractions_path / file_name).read_bytes() == (Path('testing/extractions') / file_name).read_bytes()
+
+    # every missing extraction is requested once and the connections are reused
+    paths = [path for client_address, path, code in first_requests]
+    assert len(paths) == len(set(paths))
+    assert len({client_address for client_address, path, code in first_requests}) < len(first_requests)
+
+    assert {code for client_address, path, code in first_requests} == {200, 404}
+    assert {code for client_address, path, code in second_requests} == {304}
+    assert {path for client_address, path, code in second_requests} == \
+        {path for client_address, path, code in first_requests if code == 200}
+
+    # the files without content in the cache are downloaded again
+    assert {code for client_address, path, code in removed_requests} == {200}
+    for file_name in files:
+        assert (removed_path / file_name).read_bytes() == (Path('testing/extractions') / file_name).read_bytes()
+
+
+def test_main_fetch_timeout(run):
+    extractions_path = Path('testing') / 'tmp' / 'fetch-timeout'
+
+    shutil.rmtree(extractions_path, ignore_errors=True)
+
+    # a location which accepts connections, but never responds
+    stalled = socket.socket()
+    stalled.bind(('127.0.0.1', 0))
+    stalled.listen(128)
+
+    try:
+        run('linear', '--datasets-path', 'testing/datasets', '--extractions-path', str(extractions_path),
+            '--extractions-locations', f'http://127.0.0.1:{stalled.getsockname()[1]}/ testing/extractions',
+            '--extractions-only', '--extractions', 'mean', '--fetch-timeout', '0.5')
+    finally:
+        stalled.close()
+
+    # the extraction is fetched from the next location
+    file_name = 'linear_global_mean.csv'
+    assert (extractions_path / file_name).read_bytes() == (Path('testing/extractions') / file_name).read_bytes()
+
+
+def test_main_fetch_bundle(run):
+    extractions_path = Path('testing') / 'tmp' / 'fetch-bundle'
+    locations_path = Path('testing') / 'tmp' / 'fetch-bundle-locations'
+    cache_path = Path('testing') / 'tmp' / 'fetch-bundle-cache'
+
+    shutil.rmtree(extractions_path, ignore_errors=True)
+    shutil.rmtree(locations_path, ignore_errors=True)
+    shutil.rmtree(cache_path, ignore_errors=True)
+
+    # bundle the testing extractions, but serve one of them as a separate file
+    locations_path.mkdir(parents=True)
+    shutil.copy(Path('testing/extractions') / 'mask_global_meanmap.csv', locations_path)
+    for dataset in datasets:
+        with zipfile.ZipFile(locations_path / f'{dataset}.zip', 'w') as bundle:
+            for file_path in sorted(Path('testing/extractions').glob(f'{dataset}_*')):
+                if file_path.name != 'mask_global_meanmap.csv':
+                    bundle.write(file_path, file_path.name)
+
+    requests = []
+
+    class Handler(http.server.SimpleHTTPRequestHandler):
+
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, directory=str(locations_path), **kwargs)
+
+        def log_request(self, code='-', size='-'):
+            requests.append((self.path, int(code)))
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    try:
+        run(*datasets, '--datasets-path', 'testing/datasets', '--extractions-path', str(extractions_path),
+            '--extractions-locations', f'http://127.0.0.1:{server.server_port}/', '--extractions-only',
+            '--cache-path', str(cache_path))
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    files = sorted(path.name for path in Path('testing/extractions').iterdir()
+                   if path.name.startswith(tuple(f'{dataset}_' for dataset in datasets)))
+    for file_name in files:
+        assert (extractions_path / file_name).read_bytes() == (Path('testing/extractions') / file_name).read_bytes()
+
+    # only the bundles and the file which is not in the bundle were downloaded
+    assert sorted(path for path, code in requests if code == 200) == \
+        ['/linear.zip', '/mask.zip', '/mask_global_meanmap.csv']
+
+    # only the content of the single file is stored in the cache, not the bundles
+    url = f'http://127.0.0.1:{server.server_port}/mask_global_meanmap.csv'
+    assert sorted(path.name for path in (cache_path / 'fetch').iterdir()) == \
+        sorted(['index.json', hashlib.sha1(url.encode()).hexdigest()])
+
+    # the bundles can also be read from a local location
+    shutil.rmtree(extractions_path)
+    run(*datasets, '--datasets-path', 'testing/datasets', '--extractions-path', str(extractions_path),
+        '--extractions-locations', str(locations_path), '--extractions-only')
+
+    for file_name in files:
+        assert (extractions_path / file_name).read_bytes() == (Path('testing/extractions') / file_name).read_bytes()
+
+
+def test_main_plan(run, capsys):
+    extractions_path = Path('testing') / 'tmp' / 'plan'
+    locations_path = Path('testing') / 'tmp' / 'plan-locations'
+    plots_path = Path('testing') / 'tmp' / 'plan-plots'
+    cache_path = Path('testing') / 'tmp' / 'plan-cache'
+
+    shutil.rmtree(extractions_path, ignore_errors=True)
+    shutil.rmtree(locations_path, ignore_errors=True)
+    shutil.rmtree(plots_path, ignore_errors=True)
+    shutil.rmtree(cache_path, ignore_errors=True)
+
+    # the extractions of linear exist, one extraction of mask can be fetched
+    extractions_path.mkdir(parents=True)
+    locations_path.mkdir(parents=True)
+    for file_path in Path('testing/extractions').glob('linear_*'):
+        shutil.copy(file_path, extractions_path)
+    shutil.copy(Path('testing/extractions') / 'mask_global_count.csv', locations_path)
+
+    run(*datasets, '--datasets-path', 'testing/datasets', '--extractions-path', str(extractions_path),
+        '--extractions-locations', str(locations_path), '--plots-path', str(plots_path), '--plan', 'json')
+
+    plan = json.loads(capsys.readouterr().out)
+    tasks = {Path(task['path']).name: task for task in plan['tasks']}
+
+    assert tasks['linear_global_mean.csv']['status'] == 'cached'
+    assert tasks['mask_global_count.csv']['status'] == 'fetchable'
+    assert tasks['mask_global_mean.csv']['status'] == 'compute'
+    assert tasks['mask_global_mean.csv']['bytes'] == (Path('testing/datasets') / 'mask.nc').stat().st_size
+    assert plan['summary']['files'] == len({
+        file_path for task in plan['tasks'] if task['type'] == 'extraction' for file_path in task['files']
+    })
+    assert plan['summary']['plots']['compute'] > 0
+
+    # nothing was fetched, extracted or plotted
+    assert sorted(path.name for path in extractions_path.iterdir()) == \
+        sorted(path.name for path in Path('testing/extractions').glob('linear_*'))
+    assert not plots_path.exists()
+
+    # the stores and the cache are not created
+    run(*datasets, '--datasets-path', 'testing/datasets', '--extractions-path', str(extractions_path),
+        '--extractions-locations', str(locations_path), '--plots-path', str(plots_path), '--plan',
+        '--extractions-store', '--cache-path', str(cache_path))
+
+    assert 'extractions: 0 cached' in capsys.readouterr().out
+    assert not list(extractions_path.glob('*.sqlite'))
+    assert not cache_path.exists()
+
+
+def test_main_startup():
+    # the cli starts without the heavy libraries, they are imported when the extractions or plots are used
+    code = (
+        'import sys\n'
+        'from isimip_qa.main import main\n'
+        'sys.argv = ["isimip-qa", "--version"]\n'
+        'try:\n'
+        '    main()\n'
+        'except SystemExit:\n'
+        '    print(sorted(name for name in ["matplotlib", "pandas", "xarray"] if name in sys.modules))\n'
+    )
+    output = subprocess.check_output([sys.executable, '-c', code], text=True)
+    assert output.splitlines() == [__version__, '[]']
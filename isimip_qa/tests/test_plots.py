@@ -1,14 +1,21 @@
+import importlib
+import inspect
+import pkgutil
 import shutil
 from pathlib import Path
 
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
 import pytest
 from skimage.io import imread
 from skimage.metrics import structural_similarity as ssim
 
-from isimip_qa.extractions import extraction_classes
+from isimip_qa import plots
+from isimip_qa.extractions import MeanExtraction, MeanMapExtraction, extraction_classes
 from isimip_qa.main import init_settings
-from isimip_qa.models import Dataset
-from isimip_qa.plots import plot_classes
+from isimip_qa.models import Dataset, Plot, Subplot
+from isimip_qa.plots import DailyPlot, MapPlot, plot_classes
 
 datasets = [
     'linear',
@@ -54,3 +61,75 @@ def test_plot(settings, dataset_path, extraction_class, plot_class):
             similarity = ssim(img, template_img, data_range=template_img.max() - template_img.min())
 
             assert similarity > 0.999999
+
+
+@pytest.mark.parametrize('row_ranges', [False, True])
+@pytest.mark.parametrize('column_ranges', [False, True])
+def test_plot_ranges(settings, row_ranges, column_ranges):
+    init_settings(
+        datasets_path=settings.DATASETS_PATH,
+        extractions_path=settings.EXTRACTIONS_PATH,
+        plots_path=settings.PLOTS_PATH,
+        plots_format=settings.PLOTS_FORMAT,
+        row_ranges=row_ranges,
+        column_ranges=column_ranges
+    )
+
+    rng = np.random.default_rng(42)
+    subplots = [
+        Subplot(df=pd.DataFrame({'var': rng.normal(size=100)}), var='var', irow=irow, icol=icol)
+        for irow in range(3) for icol in range(4)
+    ]
+
+    plot = DailyPlot(MeanExtraction, [Dataset('linear')], path='linear')
+    for subplot in subplots:
+        # compare with the ranges of all subplots which are in the same row or column
+        same_subplots = [
+            sp for sp in subplots
+            if (not row_ranges or sp.irow == subplot.irow) and (not column_ranges or sp.icol == subplot.icol)
+        ]
+        vmin = min(sp.df[sp.df > 0].loc[:, 'var'].min() for sp in same_subplots)
+        vmax = max(sp.df['var'].max() for sp in same_subplots)
+
+        assert plot.get_vmin(subplot, subplots) == vmin
+        assert plot.get_vmax(subplot, subplots) == vmax
+        assert plot.get_ymin(subplot, subplots) == vmin * 0.99
+        assert plot.get_ymax(subplot, subplots) == vmax * 1.01
+
+
+def test_plot_map_arrays(settings):
+    extraction = MeanMapExtraction(Dataset('mask'))
+    df = extraction.read()
+
+    # the map is read as arrays, like a pivot of the long format
+    da = extraction.read_map()['var']
+    df_pivot = df.pivot(index='lat', columns='lon', values='var')
+    assert (da.lat.values == df_pivot.index.values).all()
+    assert (da.lon.values == df_pivot.columns.values).all()
+    np.testing.assert_array_equal(da.values, df_pivot.values)
+
+    # the block means ignore missing values
+    fig, ax = plt.subplots(figsize=(1, 1), dpi=10)
+    values = np.arange(400, dtype=np.float64).reshape(20, 20)
+    values[0, 0] = np.nan
+    decimated = MapPlot(MeanMapExtraction, [Dataset('mask')]).decimate(values, ax)
+    plt.close(fig)
+
+    assert decimated.shape[0] < values.shape[0] and decimated.shape[1] < values.shape[1]
+    assert np.nanmean(values[:2, :2]) == decimated[0, 0]
+
+
+def test_plot_registry():
+    # the registry needs to list every plot class of the modules in the package
+    module_classes = set()
+    for module_info in pkgutil.iter_modules(plots.__path__):
+        module = importlib.import_module(f'{plots.__name__}.{module_info.name}')
+        for module_class in vars(module).values():
+            if (
+                inspect.isclass(module_class) and issubclass(module_class, Plot)
+                and module_class.__module__ == module.__name__
+            ):
+                module_classes.add(module_class)
+
+    assert module_classes == set(plot_classes)
+    assert [plot_class.specifier for plot_class in plot_classes] == list(plots.registry)
@@ -0,0 +1,223 @@
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+from isimip_qa.extractions import (
+    CountExtraction,
+    CountMapExtraction,
+    HistogramExtraction,
+    MeanExtraction,
+    MeanMapExtraction,
+)
+from isimip_qa.main import init_settings
+from isimip_qa.models import Dataset, PointStack, Region, RegionStack
+
+datasets = [
+    'linear',
+    'mask',
+    'sine'
+]
+
+masks = {
+    'm_AAA': (slice(0, 20), slice(0, 40)),
+    'm_BBB': (slice(10, 50), slice(30, 80)),
+    'm_CCC': (slice(0, 60), slice(0, 80)),
+    'm_DDD': (slice(0, 0), slice(0, 0))
+}
+
+points = [
+    (30.12, 3.06),
+    (12.9, -18.4),
+    (10.25, 9.75),
+    (39.75, -29.75),
+    (0.0, 0.0),
+    (30.12, 3.06)
+]
+
+
+@pytest.fixture(scope='module')
+def datasets_path(tmp_path_factory):
+    # use a smaller grid for the datasets, the extractions on the full grid are too slow
+    datasets_path = tmp_path_factory.mktemp('datasets')
+    for dataset in datasets:
+        with xr.open_dataset(Path('testing') / 'datasets' / f'{dataset}.nc') as ds:
+            ds = ds.isel(lat=slice(100, 160), lon=slice(300, 380)).load()
+        ds.to_netcdf(datasets_path / f'{dataset}.nc')
+    return datasets_path
+
+
+@pytest.fixture(scope='module')
+def mask_path(tmp_path_factory, datasets_path):
+    ds = xr.open_dataset(datasets_path / 'linear.nc')
+
+    mask_ds = xr.Dataset(coords={'lat': ds.lat, 'lon': ds.lon})
+    for mask_variable, (lat_slice, lon_slice) in masks.items():
+        mask = np.zeros((ds.lat.size, ds.lon.size))
+        mask[lat_slice, lon_slice] = 1
+        mask_ds[mask_variable] = (('lat', 'lon'), mask)
+
+    mask_path = tmp_path_factory.mktemp('masks') / 'masks.nc'
+    mask_ds.to_netcdf(mask_path)
+    return mask_path
+
+
+@pytest.fixture(scope='module')
+def settings(tmp_path_factory, datasets_path):
+    return init_settings(
+        datasets_path=datasets_path,
+        extractions_path=tmp_path_factory.mktemp('extractions'),
+        cache_path=tmp_path_factory.mktemp('cache')
+    )
+
+
+def get_regions(mask_path):
+    return [
+        Region(type='mask', specifier=f'mask-{mask_variable.lower()}',
+               mask_path=str(mask_path), mask_variable=mask_variable)
+        for mask_variable in masks
+    ]
+
+
+def extract(extractions, dataset):
+    for file in dataset.files:
+        file.open()
+        for extraction in extractions:
+            extraction.extract(file)
+        file.close()
+
+    return [pd.read_csv(extraction.path) for extraction in extractions]
+
+
+@pytest.mark.parametrize('dataset_path', datasets)
+@pytest.mark.parametrize('extraction_class', [CountExtraction, MeanExtraction])
+def test_region_stack(settings, mask_path, dataset_path, extraction_class):
+    dataset = Dataset(dataset_path)
+
+    regions = get_regions(mask_path)
+    dfs = extract([extraction_class(dataset, region) for region in regions], dataset)
+
+    stack_regions = get_regions(mask_path)
+    RegionStack(stack_regions)
+    stack_dfs = extract([extraction_class(dataset, region) for region in stack_regions], dataset)
+
+    for df, stack_df in zip(dfs, stack_dfs):
+        pd.testing.assert_frame_equal(df, stack_df)
+
+
+def test_region_stack_reduce(settings, mask_path, monkeypatch):
+    dataset = Dataset('mask')
+
+    reduce = RegionStack.reduce
+    calls = []
+
+    def count_reduce(self, ds, function):
+        calls.append(self)
+        return reduce(self, ds, function)
+
+    monkeypatch.setattr(RegionStack, 'reduce', count_reduce)
+
+    # the stack is reduced once per file for the counts and once for the means, even if the regions
+    # are selected by other extractions in between
+    regions = get_regions(mask_path)
+    RegionStack(regions)
+    extractions = [
+        extraction_class(dataset, region)
+        for region in regions
+        for extraction_class in [CountExtraction, CountMapExtraction, HistogramExtraction,
+                                 MeanExtraction, MeanMapExtraction]
+    ]
+    extract(extractions, dataset)
+
+    assert len(calls) == 2 * len(dataset.files)
+
+
+def test_region_bbox(settings, mask_path):
+    mask_ds = xr.open_dataset(mask_path)
+    for region in get_regions(mask_path):
+        footprint = region.footprint.reindex_like(mask_ds, fill_value=False)
+        assert (footprint == (mask_ds[region.mask_variable] == 1)).all()
+
+
+def test_region_cache(settings, mask_path):
+    regions = get_regions(mask_path)
+
+    # create the regions again, this time from the compiled masks in the cache
+    settings.MASKS.clear()
+    cached_regions = get_regions(mask_path)
+
+    assert settings.MASKS[str(mask_path)].ds is None
+    for region, cached_region in zip(regions, cached_regions):
+        assert region.bbox == cached_region.bbox
+        assert region.footprint.equals(cached_region.footprint)
+
+
+def test_region_cache_prune(settings, mask_path):
+    get_regions(mask_path)
+    cache_path = settings.MASKS[str(mask_path)].cache_path
+
+    # compile the masks again after the mask file was changed, the previous version is removed from the cache
+    mask_path.touch()
+    settings.MASKS.clear()
+    regions = get_regions(mask_path)
+
+    assert not cache_path.exists()
+    assert list(cache_path.parent.iterdir()) == [settings.MASKS[str(mask_path)].cache_path]
+    assert regions[0].mask is regions[0].mask
+
+
+@pytest.mark.parametrize('dataset_path', datasets)
+@pytest.mark.parametrize('extraction_class', [CountMapExtraction, HistogramExtraction, MeanMapExtraction])
+def test_region_bbox_extraction(settings, mask_path, dataset_path, extraction_class):
+    dataset = Dataset(dataset_path)
+    regions = get_regions(mask_path)
+
+    # extract the regions a second time using the full masks
+    full_regions = get_regions(mask_path)
+    for region in full_regions:
+        region.has_grid = lambda ds: False
+
+    dfs = extract([extraction_class(dataset, region) for region in regions], dataset)
+    full_dfs = extract([extraction_class(dataset, region) for region in full_regions], dataset)
+
+    for df, full_df in zip(dfs, full_dfs):
+        # the histogram of a region without valid values is not defined
+        if 'bin' not in df or df['bin'].notna().all():
+            pd.testing.assert_frame_equal(df, full_df)
+
+
+@pytest.mark.parametrize('dataset_path', datasets)
+@pytest.mark.parametrize('extraction_class', [HistogramExtraction, MeanExtraction])
+def test_point_stack(settings, dataset_path, extraction_class):
+    dataset = Dataset(dataset_path)
+
+    def get_point_regions():
+        return [
+            Region(type='point', specifier=f'point-{i}', lat=lat, lon=lon)
+            for i, (lat, lon) in enumerate(points)
+        ]
+
+    regions = get_point_regions()
+    dfs = extract([extraction_class(dataset, region) for region in regions], dataset)
+
+    stack_regions = get_point_regions()
+    PointStack(stack_regions)
+    stack_dfs = extract([extraction_class(dataset, region) for region in stack_regions], dataset)
+
+    for df, stack_df in zip(dfs, stack_dfs):
+        pd.testing.assert_frame_equal(df, stack_df)
+
+
+def test_point_stack_duplicates(settings):
+    dataset = Dataset('sine')
+
+    # the same region can be given twice, e.g. with --regions point-0,point-0
+    region = Region(type='point', specifier='point-0', lat=points[0][0], lon=points[0][1])
+    stack_regions = [Region(type='point', specifier='point-0', lat=points[0][0], lon=points[0][1]) for _ in range(2)]
+    PointStack(stack_regions)
+
+    df, = extract([MeanExtraction(dataset, region)], dataset)
+    for stack_df in extract([MeanExtraction(dataset, region) for region in stack_regions], dataset):
+        pd.testing.assert_frame_equal(df, stack_df)
@@ -0,0 +1,186 @@
+import hashlib
+
+import cftime
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from .config import settings
+
+
+def iter_time_chunks(da):
+    # iterate over the chunks of the time axis of a (dask) data array,
+    # so that only one chunk needs to be in memory at once
+    if da.chunks:
+        sizes = da.chunks[da.get_axis_num('time')]
+    else:
+        sizes = (da.sizes['time'], )
+
+    start = 0
+    for size in sizes:
+        yield da.isel(time=slice(start, start + size))
+        start += size
+
+
+def get_grid_key(ds):
+    return hashlib.sha1(ds.lat.values.tobytes() + ds.lon.values.tobytes()).hexdigest()
+
+
+def get_weights(ds, gridarea=None, region=None):
+    # the weights are cached for every grid, so that they are only computed once
+    grid_key = get_grid_key(ds)
+    key = (grid_key, gridarea is not None)
+
+    if key not in settings.WEIGHTS:
+        if gridarea is None:
+            lat = ds.lat.values
+            if lat.size < 2:
+                values = np.ones(lat.size)
+            else:
+                lat_diff = np.diff(lat)
+                if np.allclose(lat_diff, lat_diff[0]):
+                    # for regular grids, the edges of the cells are half a step away from the center
+                    lat_delta = 0.5 * abs(lat_diff[0])
+                    lat_upper, lat_lower = lat + lat_delta, lat - lat_delta
+                else:
+                    # for irregular grids, the edges of the cells are in the middle between the centers
+                    lat_edges = np.concatenate((
+                        [1.5 * lat[0] - 0.5 * lat[1]],
+                        0.5 * (lat[1:] + lat[:-1]),
+                        [1.5 * lat[-1] - 0.5 * lat[-2]]
+                    ))
+                    lat_upper = np.maximum(lat_edges[:-1], lat_edges[1:])
+                    lat_lower = np.minimum(lat_edges[:-1], lat_edges[1:])
+
+                # the area of a cell is proportional to the difference of the sine of its edges
+                lat_upper, lat_lower = np.clip(lat_upper, -90, 90), np.clip(lat_lower, -90, 90)
+                values = np.sin(np.deg2rad(lat_upper)) - np.sin(np.deg2rad(lat_lower))
+
+            weights = xr.DataArray(values, dims=('lat', ), coords={'lat': ds.lat})
+        else:
+            weights = gridarea
+
+        settings.WEIGHTS[key] = weights
+
+    if region is not None and region.has_grid(ds):
+        region_key = (grid_key, gridarea is not None, region.specifier)
+        if region_key not in settings.WEIGHTS:
+            # restrict the weights to the footprint of the region and normalize them
+            weights = settings.WEIGHTS[key].broadcast_like(ds.lon).transpose('lat', 'lon')
+            weights = weights.isel(region.bbox).where(region.footprint, 0)
+            settings.WEIGHTS[region_key] = weights / weights.sum() if weights.sum() > 0 else weights
+
+        return settings.WEIGHTS[region_key]
+    else:
+        return settings.WEIGHTS[key]
+
+
+def get_map_arrays(ds):
+    # convert a map to numpy arrays, e.g. to store it with np.savez
+    arrays = {'lat': ds.lat.values, 'lon': ds.lon.values}
+    for name, var in ds.data_vars.items():
+        arrays['var_' + name] = var.transpose('lat', 'lon').values
+    return arrays
+
+
+def get_map_dataset(arrays):
+    return xr.Dataset({
+        key[4:]: (('lat', 'lon'), value) for key, value in arrays.items() if key.startswith('var_')
+    }, coords={'lat': arrays['lat'], 'lon': arrays['lon']})
+
+
+def get_map(df):
+    # convert a map in long format to 2d arrays, the rows are placed using the indexes of their coordinates
+    lat, lat_index = np.unique(df['lat'].values, return_inverse=True)
+    lon, lon_index = np.unique(df['lon'].values, return_inverse=True)
+
+    data_vars = {}
+    for name in df.columns:
+        if name not in ['lat', 'lon']:
+            values = np.full((lat.size, lon.size), np.nan)
+            values[lat_index, lon_index] = df[name].values
+            data_vars[name] = (('lat', 'lon'), values)
+
+    return xr.Dataset(data_vars, coords={'lat': lat, 'lon': lon})
+
+
+def get_time_groups(index, resolution):
+    # the keys to group a time series, they work for pandas and cftime indexes
+    if resolution == 'yearly':
+        return [pd.Index(index.year, name='year')]
+    elif resolution == 'monthly':
+        return [pd.Index(index.year, name='year'), pd.Index(index.month, name='month')]
+    elif resolution == 'dayofyear':
+        return [pd.Index(index.dayofyear, name='dayofyear')]
+
+
+def parse_times(times):
+    # numpy datetimes with a resolution of seconds cover all years, unlike the nanoseconds used by pandas
+    times = np.asarray(times)
+    try:
+        return pd.DatetimeIndex(times.astype('datetime64[s]'))
+    except ValueError:
+        # dates which are not valid in the standard calendar are set to NaT
+        return pd.DatetimeIndex(np.array([parse_time(time) for time in times], dtype='datetime64[s]'))
+
+
+def parse_time(time):
+    try:
+        return np.datetime64(time, 's')
+    except ValueError:
+        return np.datetime64('NaT', 's')
+
+
+def parse_cftimes(times, calendar):
+    # cftime can represent the dates of non-standard calendars, e.g. 2000-02-30 in a 360_day calendar,
+    # the times are converted to seconds since the start of their month, so that only the start of each month
+    # needs to be computed, a mask of the valid times and an index of these times are returned
+    units = 'seconds since 0001-01-01'
+    valid, (year, month, day, hour, minute, second) = get_time_parts(times)
+    valid &= (month >= 1) & (month <= 12) & (day >= 1)
+
+    rows = np.flatnonzero(valid)
+    months, inverse = np.unique(year[rows] * 12 + month[rows] - 1, return_inverse=True)
+    bounds = np.union1d(months, months + 1)
+    offsets = get_month_offsets(bounds, units, calendar)
+    starts = offsets[np.searchsorted(bounds, months)][inverse]
+    lengths = offsets[np.searchsorted(bounds, months + 1)][inverse] - starts
+
+    # the months which cannot be represented in the calendar have no length
+    days = (day[rows] - 1) * 86400
+    offsets = starts + days + hour[rows] * 3600 + minute[rows] * 60 + second[rows]
+    valid[rows] = days < lengths
+
+    # the months with missing days, e.g. 1582-10 in the standard calendar, are left to cftime
+    for index in np.flatnonzero(lengths < 28 * 86400):
+        row = rows[index]
+        try:
+            date = cftime.datetime(year[row], month[row], day[row], hour[row], minute[row], second[row],
+                                   calendar=calendar)
+            offsets[index] = cftime.date2num(date, units, calendar=calendar)
+            valid[row] = True
+        except ValueError:
+            valid[row] = False
+
+    offsets = offsets[valid[rows]].astype(np.int64)
+    return valid, xr.CFTimeIndex(cftime.num2date(offsets, units, calendar=calendar))
+
+
+def get_time_parts(times):
+    # split the times (e.g. YYYY-MM-DD or YYYY-MM-DD HH:MM:SS) into year, month, day, hour, minute and second
+    parts = pd.Series(np.asarray(times, dtype=str)).str.extract(r'^(-?\d+)-(\d+)-(\d+)(?:[ T](\d+):(\d+):(\d+))?')
+    valid = parts[[0, 1, 2]].notna().all(axis=1).to_numpy()
+    return valid, parts.fillna('0').astype(np.int64).to_numpy().T
+
+
+def get_month_offsets(months, units, calendar):
+    # return the offsets of the start of the months, which are given as year * 12 + month - 1
+    offsets = np.full(months.size, np.nan)
+    for index, month in enumerate(months):
+        try:
+            date = cftime.datetime(month // 12, month % 12 + 1, 1, calendar=calendar)
+            offsets[index] = cftime.date2num(date, units, calendar=calendar)
+        except ValueError:
+            pass
+
+    return offsets